@@ -0,0 +1,87 @@
+def get_adaptive_input(coarse_interval):
+    """Prompt for the adaptive settings; returns a dict, or None on invalid input."""
+    try:
+        fine_interval = int(input("Enter the fine interval in seconds [Default: 1]: ") or 1)
+        threshold = float(input("Enter the utilization (%) that switches to the fine interval [Default: 80]: ") or 80)
+        calm_samples = int(input("Enter the number of calm fine samples before switching back [Default: 5]: ") or 5)
+        duration = int(input("Enter the capture duration in seconds [Default: 300]: ") or 300)
+    except ValueError:
+        print("Fine interval, threshold, calm samples and duration must be numeric values.")
+        return None
+    if fine_interval <= 0 or fine_interval > coarse_interval:
+        print("The fine interval must be positive and no longer than the coarse interval.")
+        return None
+    return {'coarse_interval': coarse_interval, 'fine_interval': fine_interval, 'threshold': threshold,
+            'calm_samples': calm_samples, 'duration': duration}
+
+def run_adaptive(capture_sample, coarse_interval, fine_interval, threshold, calm_samples, duration):
+    """Sample at coarse_interval, switching to fine_interval while utilization is at or above threshold.
+
+    capture_sample(interval) runs the collector for one sample and returns
+    (header, rows, peak): the CSV header, the data rows of that sample and the
+    highest per-CPU or per-thread utilization among them. Every row gets the
+    interval it was sampled with appended as an 'Interval' column. Returns to
+    the coarse interval after calm_samples fine samples below the threshold.
+    Stops after duration seconds or on Ctrl+C.
+    """
+    header, rows, switches = None, [], []
+    interval, calm, elapsed = coarse_interval, 0, 0
+
+    try:
+        while elapsed < duration:
+            sample_header, sample_rows, peak = capture_sample(interval)
+            header = header or sample_header
+            rows += [row + [interval] for row in sample_rows]
+            elapsed += interval
+
+            if peak is not None and peak >= threshold:
+                calm = 0
+                if interval != fine_interval:
+                    switches.append({'elapsed_s': elapsed, 'interval': fine_interval, 'peak': peak})
+                    interval = fine_interval
+            elif interval != coarse_interval:
+                calm += 1
+                if calm >= calm_samples:
+                    switches.append({'elapsed_s': elapsed, 'interval': coarse_interval, 'peak': peak})
+                    interval, calm = coarse_interval, 0
+    except KeyboardInterrupt:
+        print("Adaptive capture stopped.")
+
+    if header is None:
+        return [], switches
+    return [header + ['Interval']] + rows, switches
+
+def weighted_average_rows(rows, key_columns, metric_columns):
+    """'Average:' rows per key, each metric weighted by the Interval of its samples.
+
+    rows is header first, as returned by run_adaptive(). Columns that are neither
+    keys nor metrics are written as '-' (Epoch as ''), Interval as the total time.
+    """
+    header = rows[0]
+    interval_idx = header.index('Interval')
+    key_idx = [header.index(col) for col in key_columns]
+    metric_idx = [header.index(col) for col in metric_columns]
+    totals = {}
+
+    for row in rows[1:]:
+        key = tuple(row[i] for i in key_idx)
+        weight = float(row[interval_idx])
+        entry = totals.setdefault(key, {'weight': 0.0, 'sums': [0.0] * len(metric_idx)})
+        entry['weight'] += weight
+        for n, i in enumerate(metric_idx):
+            try:
+                entry['sums'][n] += float(row[i]) * weight
+            except ValueError:
+                pass
+
+    averages = [['Average:'] + header[1:]]
+    for key, entry in totals.items():
+        row = ['' if col == 'Epoch' else '-' for col in header]
+        row[0] = 'Average:'
+        for value, i in zip(key, key_idx):
+            row[i] = value
+        for total, i in zip(entry['sums'], metric_idx):
+            row[i] = f"{total / entry['weight']:.2f}"
+        row[interval_idx] = int(entry['weight'])
+        averages.append(row)
+    return averages
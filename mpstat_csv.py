@@ -1,7 +1,12 @@
 import subprocess
 import csv
-import re
 import os
+from stage_timing import stage
+from sysstat_time import ReportClock, split_timestamp, sysstat_env
+from segment_store import run_daemon, run_collector, get_daemon_input
+from adaptive_sampling import get_adaptive_input, run_adaptive, weighted_average_rows
+from sysstat_exporter import get_exporter_input, run_exporter
+from run_metadata import measure_children, measure_self, collector_metadata, write_run_metadata, read_cpu_topology
 
 def parse_cpu_cores(cpu_cores):
     if not cpu_cores or cpu_cores.upper() == "ALL":
@@ -28,12 +33,15 @@ def get_unique_filename(directory, filename):
 
     return filename
 
-def get_user_input():
+def get_user_input(mode="once"):
     cpu_cores = input("Enter CPU cores to monitor (e.g., 'ALL', '0,1,4', '0-2') [Default: ALL]: ") or "ALL"
     interval = input("Enter interval in seconds [Default: 1]: ") or "1"
-    count = input("Enter number of samples [Default: 20]: ") or "20"
-    output_dir = input("Enter directory to save CSV files [Default: mpstat_data]: ") or "mpstat_data"
-    output_file = input("Enter output CSV filename (without path) [Default: cpu_usage.csv]: ") or "cpu_usage.csv"
+    # In daemon mode the segment length sets the sample count and the manifest names the files;
+    # in adaptive mode the capture duration does
+    count = "0" if mode != "once" else input("Enter number of samples [Default: 20]: ") or "20"
+    # The exporter keeps its samples in memory and writes no files
+    output_dir = "" if mode == "exporter" else input("Enter directory to save CSV files [Default: mpstat_data]: ") or "mpstat_data"
+    output_file = "" if mode in ("daemon", "exporter") else input("Enter output CSV filename (without path) [Default: cpu_usage.csv]: ") or "cpu_usage.csv"
 
     try:
         interval = int(interval)
@@ -47,18 +55,30 @@ def get_user_input():
         return None, None, None, None, None
 
     # Create the directory if it doesn't exist
-    if not os.path.exists(output_dir):
+    if output_dir and not os.path.exists(output_dir):
         os.makedirs(output_dir)
         print(f"Directory '{output_dir}' created.")
 
     # Ensure filename is unique
-    output_file = get_unique_filename(output_dir, output_file)
+    if output_file:
+        output_file = get_unique_filename(output_dir, output_file)
 
     return parsed_cpu_cores, interval, count, output_dir, output_file
 
-def run_mpstat(cpu_cores, interval, count):
+# Interrupt tables that 'mpstat -I' can print next to the utilization table
+INTERRUPT_TABLES = ["SUM", "CPU", "SCPU"]
+SOFTIRQ_COLUMNS = {"HI/s", "TIMER/s", "NET_TX/s", "NET_RX/s", "BLOCK/s", "SCHED/s", "RCU/s"}
+
+def mpstat_command(cpu_cores, interval, count, interrupts=None):
     command = ["mpstat", "-P", cpu_cores, str(interval), str(count)]
-    result = subprocess.run(command, capture_output=True, text=True)
+    if interrupts:
+        # One run prints the utilization table followed by the requested interrupt tables
+        command[1:1] = ["-u", "-I", interrupts]
+    return command
+
+def run_mpstat(cpu_cores, interval, count, interrupts=None):
+    command = mpstat_command(cpu_cores, interval, count, interrupts)
+    result = subprocess.run(command, capture_output=True, text=True, env=sysstat_env())
     return result.stdout
 
 def parse_mpstat_output(output):
@@ -66,37 +86,121 @@ def parse_mpstat_output(output):
     data = []
     timestamp = None
     first_header_found = False  # Track first occurrence of the "CPU" header row
+    in_utilization = True  # False while inside an 'mpstat -I' interrupt table
+    clock = ReportClock()
 
     for index, line in enumerate(lines):
         fields = line.split()
-        if len(fields) < 12:
-            continue  # Skip malformed lines
+        if not fields:
+            continue
+        if fields[0] == "Linux":
+            clock.feed_header(line)  # Report date, used for the Epoch column
+            continue
+
+        time_fields = split_timestamp(fields)
+        if time_fields:
+            # Header rows and interrupt tables get no epoch but may be the last rows before midnight
+            clock.observe(" ".join(fields[:time_fields]))
 
-        # Match timestamp in format HH:MM:SS AM/PM
-        if re.match(r"^\d{2}:\d{2}:\d{2} (AM|PM)", line):
-            if fields[2] == "CPU":
+        # Every table starts with a header row; only the utilization table has %idle
+        if "CPU" in fields[:3]:
+            in_utilization = "%idle" in fields
+        if not in_utilization or len(fields) < 12:
+            continue  # Skip malformed lines and interrupt tables
+
+        # Match timestamp as HH:MM:SS AM/PM, HH:MM:SS or ISO date and time
+        if time_fields:
+            cpu = fields[time_fields]
+            values = fields[time_fields + 1:]
+            timestamp = " ".join(fields[:time_fields])  # Normal timestamp
+            if cpu == "CPU":
+                epoch = "Epoch"
                 if not first_header_found:
                     first_header_found = True
                     timestamp = "Timestamp"  # Replace timestamp with "Timestamp"
-                else:
-                    timestamp = f"{fields[0]} {fields[1]}"  # Normal timestamp for others
             else:
-                timestamp = f"{fields[0]} {fields[1]}"  # Normal timestamp
-            cpu = fields[2]
-            values = fields[3:]
+                epoch = clock.epoch(timestamp)
 
         elif fields[0].lower() == "average:":  # Handle 'Average' row
             timestamp = "Average:"
             cpu = fields[1]
             values = fields[2:]
+            epoch = "Epoch" if cpu == "CPU" else ""
 
         else:
             continue  # Ignore unexpected lines
 
-        data.append([timestamp, cpu] + values)
+        data.append([timestamp, cpu] + values + [epoch])
 
     return data
 
+def _interrupt_table_kind(header):
+    if "intr/s" in header:
+        return "SUM"
+    if SOFTIRQ_COLUMNS & set(header):
+        return "SCPU"
+    return "CPU"
+
+def parse_mpstat_interrupts(output):
+    """Split 'mpstat -I' output into one wide table per kind ('SUM', 'CPU', 'SCPU').
+
+    Each table is a list of rows whose first row is the header
+    (Timestamp, CPU, <one column per interrupt source>, Epoch). Rows are kept wide,
+    exactly as mpstat prints them, so the loader can melt them in one step.
+    """
+    tables = {}
+    kind = None
+    skipped = 0
+    clock = ReportClock()
+
+    for line in output.strip().splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+        if fields[0] == "Linux":
+            clock.feed_header(line)
+            continue
+
+        time_fields = split_timestamp(fields)
+        if time_fields:
+            timestamp = " ".join(fields[:time_fields])
+            rest = fields[time_fields:]
+            # Header rows and utilization rows get no epoch here but may be the last rows before midnight
+            clock.observe(timestamp)
+        elif fields[0].lower() == "average:":
+            timestamp = "Average:"
+            rest = fields[1:]
+        else:
+            continue
+
+        if rest and rest[0] == "CPU":
+            kind = None if "%idle" in rest else _interrupt_table_kind(rest)
+            if kind and kind not in tables:
+                tables[kind] = [["Timestamp"] + rest + ["Epoch"]]
+            continue
+
+        if kind is None:
+            continue
+        if len(rest) + 2 != len(tables[kind][0]):
+            skipped += 1  # The set of interrupt sources changed mid-run
+            continue
+        epoch = "" if timestamp == "Average:" else clock.epoch(timestamp)
+        tables[kind].append([timestamp] + rest + [epoch])
+
+    if skipped:
+        print(f"Skipped {skipped} interrupt rows whose columns did not match the first header.")
+    return tables
+
+def write_interrupt_tables(tables, output_dir, filename):
+    """Write each interrupt table next to the CPU CSV: cpu_usage.csv -> cpu_usage_irq_SCPU.csv"""
+    base, ext = os.path.splitext(filename)
+    paths = []
+    for kind, rows in tables.items():
+        table_file = f"{base}_irq_{kind}{ext}"
+        write_to_csv(rows, output_dir, table_file)
+        paths.append(os.path.join(output_dir, table_file))
+    return paths
+
 def write_to_csv(data, output_dir, filename):
     file_path = os.path.join(output_dir, filename)
     
@@ -106,15 +210,131 @@ def write_to_csv(data, output_dir, filename):
 
     print(f"CPU usage data written to {file_path}")
 
+def run_mpstat_daemon(cpu_cores, interval, output_dir):
+    daemon_settings = get_daemon_input()
+    if daemon_settings is None:
+        return
+    segment_seconds, max_age_seconds, max_bytes = daemon_settings
+
+    def capture_segment(seconds):
+        command = mpstat_command(cpu_cores, interval, max(1, seconds // interval))
+        return parse_mpstat_output(run_collector(command, sysstat_env()))
+
+    run_daemon('mpstat', capture_segment, output_dir, segment_seconds, max_age_seconds, max_bytes,
+               {'cpus': cpu_cores, 'interval': interval, 'topology': read_cpu_topology()})
+
+def capture_mpstat_sample(cpu_cores, interval):
+    """One 'mpstat interval 1' sample: (header, per-CPU rows, busiest CPU's 100 - %idle)."""
+    parsed = parse_mpstat_output(run_mpstat(cpu_cores, interval, 1))
+    if not parsed:
+        return None, [], None
+    header = parsed[0]
+    idle_idx = header.index("%idle")
+    rows = [row for row in parsed[1:] if row[0] != "Average:" and row[1] != "CPU"]
+    busy = [100 - float(row[idle_idx]) for row in rows if row[1] != "all"]
+    return header, rows, max(busy, default=None)
+
+def run_mpstat_adaptive(cpu_cores, interval, output_dir, output_file):
+    settings = get_adaptive_input(interval)
+    if settings is None:
+        return
+
+    print(f"Sampling every {interval}s, every {settings['fine_interval']}s while a CPU is at least "
+          f"{settings['threshold']}% busy. Press Ctrl+C to stop early.")
+    with stage('capture', mode='adaptive', duration=settings['duration']):
+        with measure_children() as sysstat_usage:
+            with measure_self() as parser_usage:
+                rows, switches = run_adaptive(lambda seconds: capture_mpstat_sample(cpu_cores, seconds), **settings)
+    if not rows:
+        print("No samples captured.")
+        return
+
+    metric_columns = [col for col in rows[0] if col.startswith('%')]
+    with stage('write', rows=len(rows)):
+        write_to_csv(rows + weighted_average_rows(rows, ['CPU'], metric_columns), output_dir, output_file)
+
+    write_run_metadata(os.path.join(output_dir, output_file), {
+        'tool': 'mpstat',
+        'cpus': cpu_cores,
+        'interval': interval,
+        'adaptive': dict(settings, switches=switches),
+        'collector': collector_metadata(sysstat_usage, parser_usage),
+        'topology': read_cpu_topology(),
+    })
+    print(f"Switched interval {len(switches)} times.")
+
+MPSTAT_EXPORTER_FAMILIES = {
+    'mpstat_cpu_percent': ('gauge', "Share of the latest interval each CPU spent in each mode."),
+    'mpstat_cpu_seconds_total': ('counter', "Seconds each CPU spent in each mode since the exporter started."),
+}
+
+def mpstat_exporter_metrics(header, rows, interval):
+    """Gauges and counter increments of one sample, labelled by CPU and mode (the column without '%')."""
+    cpu_idx = header.index("CPU")
+    metric_idx = [(i, col[1:]) for i, col in enumerate(header) if col.startswith('%')]
+    gauges, increments = {}, {}
+    for row in rows:
+        for i, mode in metric_idx:
+            labels = (('cpu', row[cpu_idx]), ('mode', mode))
+            value = float(row[i])
+            gauges[('mpstat_cpu_percent', labels)] = value
+            increments[('mpstat_cpu_seconds_total', labels)] = value / 100 * interval
+    return gauges, increments
+
+def run_mpstat_exporter(cpu_cores, interval):
+    address, port = get_exporter_input()
+    if port is None:
+        return
+    run_exporter(lambda seconds: capture_mpstat_sample(cpu_cores, seconds), mpstat_exporter_metrics,
+                 MPSTAT_EXPORTER_FAMILIES, interval, address, port)
+
 def main():
-    cpu_cores, interval, count, output_dir, output_file = get_user_input()
+    mode = input("Run mode (once/daemon/adaptive/exporter) [Default: once]: ").strip().lower() or "once"
+    if mode not in ("once", "daemon", "adaptive", "exporter"):
+        print("Invalid run mode, exiting.")
+        return
+    cpu_cores, interval, count, output_dir, output_file = get_user_input(mode)
     if cpu_cores is None:
         print("Invalid input, exiting.")
         return
 
-    output = run_mpstat(cpu_cores, interval, count)
-    parsed_data = parse_mpstat_output(output)
-    write_to_csv(parsed_data, output_dir, output_file)
+    if mode == "daemon":
+        run_mpstat_daemon(cpu_cores, interval, output_dir)
+        return
+    if mode == "adaptive":
+        run_mpstat_adaptive(cpu_cores, interval, output_dir, output_file)
+        return
+    if mode == "exporter":
+        run_mpstat_exporter(cpu_cores, interval)
+        return
+
+    interrupts = input("Also capture interrupt tables (none/SUM/CPU/SCPU/ALL) [Default: none]: ").strip().upper() or "NONE"
+    if interrupts not in INTERRUPT_TABLES + ["ALL", "NONE"]:
+        print("Invalid interrupt table, exiting.")
+        return
+    interrupts = None if interrupts == "NONE" else interrupts
+
+    with stage('capture', interval=interval, count=count):
+        with measure_children() as sysstat_usage:
+            output = run_mpstat(cpu_cores, interval, count, interrupts)
+    with stage('parse'):
+        with measure_self() as parser_usage:
+            parsed_data = parse_mpstat_output(output)
+            interrupt_tables = parse_mpstat_interrupts(output) if interrupts else {}
+    with stage('write', rows=len(parsed_data)):
+        write_to_csv(parsed_data, output_dir, output_file)
+        write_interrupt_tables(interrupt_tables, output_dir, output_file)
+
+    # Record the collector's own cost so the plots can subtract or flag it
+    write_run_metadata(os.path.join(output_dir, output_file), {
+        'tool': 'mpstat',
+        'cpus': cpu_cores,
+        'interval': interval,
+        'count': count,
+        'interrupts': interrupts,
+        'collector': collector_metadata(sysstat_usage, parser_usage),
+        'topology': read_cpu_topology(),
+    })
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,128 @@
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.backends.backend_pdf import PdfPages
+import math
+import os
+import re
+from mpstat_plot import get_file_paths
+from stage_timing import stage
+
+TOP_IRQ_SOURCES = 40  # Columns shown in the per-IRQ heatmap
+CPUS_PER_PAGE = 64
+
+# Function to pick the interrupt CSVs written by mpstat_csv (cpu_usage_irq_SCPU.csv, ...)
+def group_interrupt_files(files):
+    grouped = {}
+    for file in files:
+        match = re.search(r"_irq_(SUM|CPU|SCPU)\.csv$", file)
+        if match:
+            grouped.setdefault(match.group(1), []).append(file)
+    return grouped
+
+# Function to load wide interrupt tables into long format (File, Timestamp, CPU, Source, Rate)
+def load_interrupt_table(files, summary_only=True):
+    frames = []
+    for file in files:
+        try:
+            # The C parser handles hundreds of columns; no per-row Python work after this
+            df = pd.read_csv(file, dtype={'Timestamp': str, 'CPU': str, 'Epoch': 'Int64'})
+        except Exception as e:
+            print(f"Error processing {file}: {e}")
+            continue
+
+        is_average = df['Timestamp'] == 'Average:'
+        df = df[is_average] if summary_only else df[~is_average]
+        id_vars = [col for col in ['Timestamp', 'Epoch', 'CPU'] if col in df.columns]
+        long_df = df.melt(id_vars=id_vars, var_name='Source', value_name='Rate')
+        long_df.insert(0, 'File', os.path.basename(file))
+        frames.append(long_df)
+
+    if not frames:
+        return pd.DataFrame(columns=['File', 'Timestamp', 'CPU', 'Source', 'Rate'])
+
+    long_df = pd.concat(frames, ignore_index=True)
+    long_df['Rate'] = pd.to_numeric(long_df['Rate'], errors='coerce')
+    long_df['Source'] = long_df['Source'].str.replace('/s', '', regex=False)
+    for col in ['File', 'Timestamp', 'CPU', 'Source']:
+        long_df[col] = long_df[col].astype('category')
+    return long_df
+
+# Function to order CPUs as 'all', 0, 1, 2, ...
+def cpu_order(cpus):
+    cpus = [str(c) for c in cpus]
+    return sorted(cpus, key=lambda c: -1 if c == 'all' else int(c) if c.isdigit() else math.inf)
+
+# Function to plot total interrupt rate per core, one bar group per CSV file; the 'all' totals go in the title
+def plot_interrupt_totals(df, pdf):
+    table = df.pivot_table(index='CPU', columns='File', values='Rate', aggfunc='sum', observed=True)
+    title = 'Interrupts per second by CPU'
+    if 'all' in table.index:
+        totals = ', '.join(f"{file_name} {rate:,.0f}/s" for file_name, rate in table.loc['all'].dropna().items())
+        title += f'\nAll CPUs: {totals}'
+        table = table.drop(index='all')
+    table = table.reindex(cpu_order(table.index))
+    colors = sns.color_palette("Set2", len(table.columns))
+
+    for start in range(0, len(table), CPUS_PER_PAGE):
+        page = table.iloc[start:start + CPUS_PER_PAGE]
+        fig, ax = plt.subplots(figsize=(11, 8.5))
+        page.plot.bar(ax=ax, color=colors, width=0.8)
+        ax.set_title(title)
+        ax.set_xlabel('CPU')
+        ax.set_ylabel('intr/s')
+        ax.set_facecolor('#f0f0f0')
+        ax.grid(axis='y', linestyle='--', color='white', linewidth=0.7)
+        ax.legend(title='CSV files')
+        plt.tight_layout()
+        pdf.savefig(fig)
+        plt.close(fig)
+
+# Function to plot a CPU x source heatmap of interrupt rates for each CSV file
+def plot_interrupt_heatmaps(df, title, pdf, top_sources=None):
+    for file_name, file_df in df.groupby('File', observed=True):
+        table = file_df.pivot_table(index='CPU', columns='Source', values='Rate', aggfunc='mean', observed=True)
+        table = table.drop(index='all', errors='ignore')
+        table = table.reindex(cpu_order(table.index))
+        if top_sources:
+            busiest = table.sum().nlargest(top_sources).index
+            table = table[busiest]
+
+        for start in range(0, len(table), CPUS_PER_PAGE):
+            page = table.iloc[start:start + CPUS_PER_PAGE]
+            fig, ax = plt.subplots(figsize=(11, 8.5))
+            sns.heatmap(page, ax=ax, cmap='rocket_r', cbar_kws={'label': 'per second'})
+            ax.set_title(f'{title} - {file_name}')
+            ax.set_xlabel('Source')
+            ax.set_ylabel('CPU')
+            plt.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+if __name__ == "__main__":
+    csv_files = get_file_paths()
+    grouped = group_interrupt_files(csv_files)
+    if not grouped:
+        print("No interrupt CSVs (*_irq_SUM.csv, *_irq_CPU.csv, *_irq_SCPU.csv) found.")
+    else:
+        output_dir = "mpstat_plots"
+        os.makedirs(output_dir, exist_ok=True)
+        pdf_path = os.path.join(output_dir, "interrupts_report.pdf")
+
+        with PdfPages(pdf_path) as pdf:
+            for kind, files in grouped.items():
+                with stage('load', table=kind, files=len(files)):
+                    df = load_interrupt_table(files)
+                if df.empty:
+                    print(f"No 'Average:' rows in the {kind} interrupt tables.")
+                    continue
+
+                with stage('render', table=kind):
+                    if kind == 'SUM':
+                        plot_interrupt_totals(df, pdf)
+                    elif kind == 'SCPU':
+                        plot_interrupt_heatmaps(df, 'Softirqs per second', pdf)
+                    else:
+                        plot_interrupt_heatmaps(df, f'Top {TOP_IRQ_SOURCES} interrupts per second', pdf, TOP_IRQ_SOURCES)
+
+        print(f"Interrupt report saved to {pdf_path}")
@@ -1,4 +1,3 @@
-import pandas as pd
 import matplotlib.pyplot as plt
 import seaborn as sns
 from matplotlib.backends.backend_pdf import PdfPages
@@ -7,6 +6,10 @@ import math
 import numpy as np
 import os
 import PyPDF2
+from stage_timing import stage
+from run_metadata import read_run_metadata, collector_overhead_pct
+from segment_store import MANIFEST, segments_for_range, parse_time_bound
+from sysstat_query import load_mpstat
 
 def merge_pdfs(pdf_files, output_pdf):
     """Merge multiple PDFs into one."""
@@ -36,19 +39,32 @@ def get_file_paths():
         user_input = "."
         print("No input provided. Using the current directory (PWD) by default.")
 
-    # Option 1: If it's a directory
-    if os.path.isdir(user_input):
+    # Option 1: A daemon segment directory; open only the segments covering the requested time range
+    if os.path.isdir(user_input) and os.path.exists(os.path.join(user_input, MANIFEST)):
+        try:
+            start = parse_time_bound(input("Enter start time (YYYY-mm-dd HH:MM) [Default: oldest segment]: "))
+            end = parse_time_bound(input("Enter end time (YYYY-mm-dd HH:MM) [Default: newest segment]: "))
+        except ValueError as e:
+            print(e)
+            return []
+        csv_files = segments_for_range(user_input, start, end)
+        if not csv_files:
+            print(f"No segments in {user_input} cover the requested time range.")
+        return csv_files
+
+    # Option 2: If it's a directory
+    elif os.path.isdir(user_input):
         # Get all CSV files in the directory
         csv_files = glob.glob(os.path.join(user_input, '*.csv'))
         if not csv_files:
             print(f"No CSV files found in the directory: {user_input}")
         return csv_files
 
-    # Option 2: If it's a single CSV file
+    # Option 3: If it's a single CSV file
     elif os.path.isfile(user_input) and user_input.lower().endswith('.csv'):
         return [user_input]
 
-    # Option 3: If it's multiple CSV files (user enters them separated by commas)
+    # Option 4: If it's multiple CSV files (user enters them separated by commas)
     elif ',' in user_input:
         csv_files = [file.strip() for file in user_input.split(',')]
         # Check if each file exists and is a CSV file
@@ -62,189 +78,173 @@ def get_file_paths():
         print("Invalid path. Please provide a valid directory or CSV file(s).")
         return []
 
-# Function to load and extract CPU data
+# Function to load and extract CPU data ('Average:' rows of 'CPU all' and each core)
 def load_and_extract_cpu_data(files, metric_column):
-    #files = glob.glob(files_pattern)
-    data_frames = []
-
-    for file in files:
-        try:
-            df = pd.read_csv(file)
-            df.columns = df.columns.str.strip()
-
-            # Ensure 'Timestamp' column is handled correctly
-            timestamp_col = next((col for col in df.columns if 'timestamp' or 'Average' in col.lower()), None)
-            if not timestamp_col:
-                print(f"Warning: No 'Timestamp' column found in {file}. Skipping...")
-                continue
-
-            # Filter rows where 'Timestamp' is 'Average'
-            df_filtered = df[df[timestamp_col].astype(str).str.strip().str.lower() == 'average:']
-
-            # Ensure 'CPU' column exists and clean it
-            if 'CPU' not in df_filtered.columns:
-                print(f"Warning: No 'CPU' column in {file}. Skipping...")
-                continue
-
-            df_filtered['CPU'] = df_filtered['CPU'].astype(str).str.strip()
-
-            # Keep only rows where 'CPU' is a number or 'all'
-            df_filtered = df_filtered[df_filtered['CPU'].apply(lambda x: x == 'all' or x.isdigit())]
-
-            df_filtered['File'] = file.split('/')[-1]
-
-            if metric_column in df_filtered.columns:
-                df_filtered[metric_column] = pd.to_numeric(df_filtered[metric_column], errors='coerce')
-            else:
-                print(f"Warning: Column '{metric_column}' not found in {file}. Skipping...")
-                continue
-
-            data_frames.append(df_filtered)
-
-        except Exception as e:
-            print(f"Error processing {file}: {e}")
-
-    if not data_frames:
+    df = load_mpstat(files, metrics=[metric_column])
+    if df.empty:
         print("No valid data found in any files.")
-        return pd.DataFrame()
-
-    result_df = pd.concat(data_frames, ignore_index=True)
-    #print("Sample of filtered data:\n", result_df.head())  
-    return result_df
+    return df
+
+# Function to subtract or flag the collector's own CPU use recorded in the run metadata
+def apply_collector_overhead(df, metric_column, csv_files, mode):
+    if mode not in ('subtract', 'flag') or df.empty:
+        return df
+
+    overheads = {}
+    for file in csv_files:
+        overhead = collector_overhead_pct(read_run_metadata(file))
+        if overhead:
+            overheads[file.split('/')[-1]] = overhead
+    if not overheads:
+        print("No collector overhead recorded for these files.")
+        return df
+
+    df = df.copy()
+    if mode == 'flag':
+        # Upper bound: the whole collector cost landed on this CPU
+        df['Collector %'] = df['File'].map({f: o['single_cpu'] for f, o in overheads.items()})
+        return df
+
+    # Subtract the collector's share, spread evenly over the online CPUs
+    usr = df['File'].map({f: o['usr'] for f, o in overheads.items()}).fillna(0)
+    sys_ = df['File'].map({f: o['sys'] for f, o in overheads.items()}).fillna(0)
+    if metric_column == '%usr':
+        df[metric_column] = (df[metric_column] - usr).clip(lower=0)
+    elif metric_column == '%sys':
+        df[metric_column] = (df[metric_column] - sys_).clip(lower=0)
+    elif metric_column == '%idle':
+        df[metric_column] = (df[metric_column] + usr + sys_).clip(upper=100)
+    return df
+
+# Function to format a bar annotation, marking values the collector could have skewed
+def format_bar_label(height, collector_pct=None):
+    label = f'{height:.2f}'
+    if collector_pct is not None and not np.isnan(collector_pct) and collector_pct >= 0.1 * height:
+        label += '*'
+    return label
 
 # Function to round up to the nearest 10
 def round_up_to_10(x):
     return math.ceil(x / 10) * 10 if x > 0 else 10
 
+# Function to build the page template: the axes, one bar and one label per CSV file on each axis
+def build_page_template(slots, file_names, colors, metric_name, footnote):
+    if slots == 1:
+        fig, axs = plt.subplots(1, 1, figsize=(8.5, 11))
+        axs = np.array([axs])
+    else:
+        # A 3x2 grid (fixed size) for 2 or more subplots
+        fig, axs = plt.subplots(3, 2, figsize=(8.5, 11))
+        axs = axs.flatten()
+    fig.suptitle(f'Comparison of Metrics - {metric_name}', fontsize=16)
+
+    positions = np.arange(len(file_names))
+    bars, labels = [], []
+    for ax in axs:
+        ax.set_facecolor('#f0f0f0')  # Set subplot background color
+        ax.grid(axis='y', linestyle='--', color='white', linewidth=0.7)  # White horizontal grid lines
+        ax_bars = ax.bar(positions, np.zeros(len(file_names)), color=colors)
+        ax.set_xticks(positions, file_names)
+        ax.set_xlabel('CSV File')
+        ax.set_ylabel(metric_name)
+        ax.tick_params(axis='x', rotation=45)
+        bars.append(ax_bars)
+        labels.append([ax.text(x, 0, '', ha='center', va='bottom', fontsize=8, fontweight='bold') for x in positions])
+
+    if footnote:
+        fig.text(0.01, 0.005, '* collector overhead could account for 10% or more of this value', fontsize=8)
+    return fig, axs, bars, labels
+
+# Function to point one axis of the template at one CPU's values
+def fill_axis(ax, bars, labels, cpu, values, collector, metric_name):
+    for bar, label, height, collector_pct in zip(bars, labels, values, collector):
+        if np.isnan(height):
+            bar.set_height(0)
+            label.set_text('')
+        else:
+            bar.set_height(height)
+            label.set_y(height + 1)
+            label.set_text(format_bar_label(height, collector_pct))
+    ax.set_title(f'{metric_name} for CPU {cpu}')
+    ax.set_ylim([0, round_up_to_10(np.nanmax(values))])
+
 # Function to plot the metric with color and style adjustments
 def plot_metric(df, metric_column, metric_name, pdf_path):
     if df.empty:
         print(f"No data available for {metric_name}. Skipping PDF generation.")
         return
 
+    # Group once: a CPU x file table of values (and of collector overhead), in order of appearance
+    cpus = df['CPU'].unique()
+    file_names = df['File'].unique()
+    values = df.pivot_table(index='CPU', columns='File', values=metric_column, aggfunc='first', dropna=False)
+    values = values.reindex(index=cpus, columns=file_names).to_numpy(dtype='float64')
+    if 'Collector %' in df.columns:
+        collector = df.pivot_table(index='CPU', columns='File', values='Collector %', aggfunc='first', dropna=False)
+        collector = collector.reindex(index=cpus, columns=file_names).to_numpy(dtype='float64')
+    else:
+        collector = np.full(values.shape, np.nan)
+
+    # Get the Set2 color palette for CSV files
+    colors = sns.color_palette("Set2", len(file_names))  # Unique color for each CSV file
+    slots = 1 if len(cpus) == 1 else 6
+    fig, axs, bars, labels = build_page_template(slots, file_names, colors, metric_name, 'Collector %' in df.columns)
+
     with PdfPages(pdf_path) as pdf:
-        cpus = df['CPU'].unique()
-        num_pages = math.ceil(len(cpus) / 6)
-
-        # Get the Set2 color palette for CSV files
-        colors = sns.color_palette("Set2", len(df['File'].unique()))  # Unique color for each CSV file
-
-        for page_num in range(num_pages):
-            # Check if there's only 1 plot to display
-            if len(cpus) == 1:
-                # Create a single subplot layout (1 row, 1 column)
-                fig, axs = plt.subplots(1, 1, figsize=(8.5, 11))
-                fig.suptitle(f'Comparison of Metrics - {metric_name}', fontsize=16)
-                axs.set_facecolor('#f0f0f0')  # Set subplot background color
-                axs.grid(axis='y', linestyle='--', color='white', linewidth=0.7)  # White horizontal grid lines
-
-                cpu = cpus[0]
-                cpu_data = df[df['CPU'] == cpu]
-
-                # Get the unique CSV files and their corresponding color
-                file_names = cpu_data['File'].unique()
-                for j, file_name in enumerate(file_names):
-                    file_data = cpu_data[cpu_data['File'] == file_name]
-                    color = colors[j]
-
-                    bars = axs.bar(file_data['File'], file_data[metric_column], color=color, label=f'{file_name}')
-
-                    # Add annotations for all bars
-                    for bar in bars:
-                        height = bar.get_height()
-                        if not np.isnan(height):
-                            axs.text(bar.get_x() + bar.get_width() / 2, height + 1, f'{height:.2f}',
-                                     ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-                axs.set_title(f'{metric_name} for CPU {cpu}')
-                axs.set_xlabel('CSV File')
-                axs.set_ylabel(metric_name)
-                axs.tick_params(axis='x', rotation=45)
-
-                max_value = cpu_data[metric_column].max()
-                max_value_rounded = round_up_to_10(max_value)
-                axs.set_ylim([0, max_value_rounded])
-
-                plt.tight_layout()
+        for page_num, start_idx in enumerate(range(0, len(cpus), slots)):
+            with stage('render', metric=metric_name, page=page_num + 1):
+                page_cpus = cpus[start_idx:start_idx + slots]
+                for slot, ax in enumerate(axs):
+                    # Slots past the last CPU stay hidden on the final page
+                    ax.set_visible(slot < len(page_cpus))
+                    if slot < len(page_cpus):
+                        fill_axis(ax, bars[slot], labels[slot], page_cpus[slot], values[start_idx + slot],
+                                  collector[start_idx + slot], metric_name)
+                # The layout is the same on every page, so it is computed once; dropping the layout
+                # engine afterwards keeps savefig from drawing every page twice
+                if page_num == 0:
+                    fig.tight_layout()
+                    fig.set_layout_engine(None)
                 pdf.savefig(fig)
-                plt.close(fig)
-            else:
-                # Create a 3x2 grid (fixed size) for 2 or more subplots
-                fig, axs = plt.subplots(3, 2, figsize=(8.5, 11))
-                fig.suptitle(f'Comparison of Metrics - {metric_name}', fontsize=16)
-                axs = axs.flatten()  # Flatten the 3x2 grid into a 1D array for easier access
-
-                # Set the background color for all subplots
-                for ax in axs:
-                    ax.set_facecolor('#f0f0f0')  # Set subplot background color
-                    ax.grid(axis='y', linestyle='--', color='white', linewidth=0.7)  # White horizontal grid lines
-
-                # Plot each CPU data in available subplots
-                start_idx = page_num * 6
-                end_idx = min(start_idx + 6, len(cpus))
-
-                for i in range(start_idx, end_idx):
-                    cpu = cpus[i]
-                    cpu_data = df[df['CPU'] == cpu]
-
-                    # Get the unique CSV files and their corresponding color
-                    file_names = cpu_data['File'].unique()
-                    for j, file_name in enumerate(file_names):
-                        file_data = cpu_data[cpu_data['File'] == file_name]
-                        color = colors[j]
-
-                        bars = axs[i - start_idx].bar(file_data['File'], file_data[metric_column], color=color, label=f'{file_name}')
-
-                        # Add annotations for all bars
-                        for bar in bars:
-                            height = bar.get_height()
-                            if not np.isnan(height):
-                                axs[i - start_idx].text(bar.get_x() + bar.get_width() / 2, height + 1, f'{height:.2f}',
-                                                        ha='center', va='bottom', fontsize=8, fontweight='bold')
-
-                    axs[i - start_idx].set_title(f'{metric_name} for CPU {cpu}')
-                    axs[i - start_idx].set_xlabel('CSV File')
-                    axs[i - start_idx].set_ylabel(metric_name)
-                    axs[i - start_idx].tick_params(axis='x', rotation=45)
-
-                    max_value = cpu_data[metric_column].max()
-                    max_value_rounded = round_up_to_10(max_value)
-                    axs[i - start_idx].set_ylim([0, max_value_rounded])
-
-                # Remove empty subplots by not plotting anything on them
-                for j in range(end_idx - start_idx, len(axs)):
-                    fig.delaxes(axs[j])
-
-                plt.tight_layout()
-                pdf.savefig(fig)
-                plt.close(fig)
-# Main execution
-if __name__ == "__main__":
+    plt.close(fig)
+
+def main():
     # Get the file paths (directory, single CSV, or multiple CSVs)
     csv_files = get_file_paths()
-    generated_pdfs = []                
-    if csv_files:
-        # List of metrics you want to plot for 'CPU all' and each individual core
-        metrics = ['%usr', '%sys', '%idle', '%iowait', '%irq', '%soft', '%steal', '%guest', '%gnice']
-
-        output_dir = "mpstat_plots"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-            print(f"Directory '{output_dir}' created.")
-
-        # For each metric, generate a PDF
-        for metric in metrics:
-            # Load and extract all CPU core data (including 'CPU all') from the CSV files
+    if not csv_files:
+        return
+
+    # List of metrics you want to plot for 'CPU all' and each individual core
+    metrics = ['%usr', '%sys', '%idle', '%iowait', '%irq', '%soft', '%steal', '%guest', '%gnice']
+
+    overhead_mode = input("Collector overhead handling (none/subtract/flag) [Default: none]: ").strip().lower() or "none"
+
+    output_dir = "mpstat_plots"
+    if not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+        print(f"Directory '{output_dir}' created.")
+
+    # For each metric, generate a PDF
+    generated_pdfs = []
+    for metric in metrics:
+        # Load and extract all CPU core data (including 'CPU all') from the CSV files
+        with stage('load', metric=metric, files=len(csv_files)):
             df = load_and_extract_cpu_data(csv_files, metric)
-                
-            if not df.empty:
-                # Define the full path for the output PDF
-                pdf_path = os.path.join(output_dir, f'{metric}_comparison.pdf')
-                plot_metric(df, metric, metric, pdf_path)
-                generated_pdfs.append(pdf_path)
+            df = apply_collector_overhead(df, metric, csv_files, overhead_mode)
+
+        if not df.empty:
+            # Define the full path for the output PDF
+            pdf_path = os.path.join(output_dir, f'{metric}_comparison.pdf')
+            plot_metric(df, metric, metric, pdf_path)
+            generated_pdfs.append(pdf_path)
             print(f'{metric} comparison saved to {pdf_path}')
-    
-    merged_output_pdf = os.path.join(output_dir, "mpstat_comparison_merged.pdf")
-    merge_pdfs(generated_pdfs, merged_output_pdf)
-    print(f"Final merged PDF saved to {merged_output_pdf}")
 
+    if generated_pdfs:
+        merged_output_pdf = os.path.join(output_dir, "mpstat_comparison_merged.pdf")
+        with stage('merge', pdfs=len(generated_pdfs)):
+            merge_pdfs(generated_pdfs, merged_output_pdf)
+        print(f"Final merged PDF saved to {merged_output_pdf}")
+
+# Main execution
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.backends.backend_pdf import PdfPages
+import math
+import os
+from mpstat_plot import get_file_paths
+from stage_timing import stage
+from sysstat_query import load_mpstat
+from sysstat_anomaly import load_incidents
+
+AGGREGATIONS = ['mean', 'max', 'last']
+
+# Function to load the per-interval rows (not 'Average:') with seconds since the start of each run
+def load_interval_data(files, metrics):
+    df = load_mpstat(files, metrics=metrics, summary_only=False)
+    if df.empty:
+        return df
+
+    data_frames = []
+    for file_name, run in df.groupby('File', sort=False):
+        if run['Epoch'].notnull().all():
+            absolute = run['Epoch'].astype('int64')
+        else:
+            # CSVs written before the Epoch column: parse the 12-hour display timestamps
+            times = pd.to_datetime(run['Timestamp'], format='%I:%M:%S %p', errors='coerce')
+            run = run[times.notnull()]
+            times = times[times.notnull()]
+            if run.empty:
+                print(f"Warning: {file_name} has no parsable timestamps. Skipping...")
+                continue
+
+            # Seconds of day, plus a day for every midnight rollover
+            seconds = times.dt.hour * 3600 + times.dt.minute * 60 + times.dt.second
+            days = (seconds.diff() < 0).cumsum()
+            absolute = seconds + days * 86400
+        data_frames.append(run.assign(Elapsed=(absolute - absolute.min()).astype('int64'))[['File', 'CPU', 'Elapsed', 'Interval'] + metrics])
+
+    if not data_frames:
+        return pd.DataFrame()
+    return pd.concat(data_frames, ignore_index=True)
+
+# Function to put every run on a common grid of 'grid' seconds since its start
+def resample_runs(df, metrics, grid, agg='mean'):
+    if agg not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{agg}', expected one of {AGGREGATIONS}")
+    binned = df.assign(Elapsed=(df['Elapsed'] // grid) * grid)
+    if agg == 'mean' and 'Interval' in df.columns and df['Interval'].notnull().any():
+        # Samples of adaptive captures stand for different lengths of time: weight them by their interval
+        weights = df['Interval'].fillna(1).astype('float64')
+        keys = [binned['File'], binned['CPU'], binned['Elapsed']]
+        result = pd.DataFrame({
+            metric: binned[metric].mul(weights).groupby(keys, sort=True).sum()
+            / weights.where(binned[metric].notnull(), 0).groupby(keys, sort=True).sum()
+            for metric in metrics
+        })
+        return result.rename_axis(['File', 'CPU', 'Elapsed']).reset_index()
+    return binned.groupby(['File', 'CPU', 'Elapsed'], sort=True)[metrics].agg(agg).reset_index()
+
+# Function to line runs up sample by sample: one column per file, rows keyed by (CPU, Elapsed)
+def align_runs(resampled, metric):
+    return resampled.pivot_table(index=['CPU', 'Elapsed'], columns='File', values=metric, aggfunc='first')
+
+# Function to subtract the baseline run from every other run
+def diff_runs(aligned, baseline):
+    return aligned.drop(columns=baseline).sub(aligned[baseline], axis=0)
+
+# Function to overlay the aligned runs, six CPUs per page, shading the incidents found by sysstat_anomaly.py
+def plot_overlay(aligned, metric, grid, agg, pdf_path, incidents=None):
+    if incidents is not None:
+        # Only the incidents of this metric; 'busy' incidents are derived from %idle
+        incidents = incidents[incidents['Metric'].isin([metric, 'busy'] if metric == '%idle' else [metric])]
+    cpus = sorted(aligned.index.get_level_values('CPU').unique(), key=lambda c: -1 if c == 'all' else int(c))
+    colors = sns.color_palette("Set2", len(aligned.columns))
+
+    with PdfPages(pdf_path) as pdf:
+        for page_num in range(math.ceil(len(cpus) / 6)):
+            fig, axs = plt.subplots(3, 2, figsize=(8.5, 11))
+            fig.suptitle(f'{metric} every {grid}s ({agg}) since start of run', fontsize=14)
+            axs = axs.flatten()
+            page_cpus = cpus[page_num * 6:(page_num + 1) * 6]
+
+            for ax, cpu in zip(axs, page_cpus):
+                cpu_data = aligned.xs(cpu, level='CPU')
+                for color, file_name in zip(colors, aligned.columns):
+                    ax.plot(cpu_data.index, cpu_data[file_name], color=color, label=file_name, linewidth=1)
+                    if incidents is not None:
+                        cpu_incidents = incidents[(incidents['File'] == file_name) & (incidents['Key'] == cpu)]
+                        for start_s, end_s in zip(cpu_incidents['Start_s'], cpu_incidents['End_s']):
+                            ax.axvspan(start_s, end_s + 1, color=color, alpha=0.25, linewidth=0)
+                ax.set_title(f'{metric} for CPU {cpu}')
+                ax.set_xlabel('Seconds since start')
+                ax.set_ylabel(metric)
+                ax.set_facecolor('#f0f0f0')
+                ax.grid(axis='y', linestyle='--', color='white', linewidth=0.7)
+
+            for ax in axs[len(page_cpus):]:
+                fig.delaxes(ax)
+            axs[0].legend(fontsize=7)
+            plt.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+if __name__ == "__main__":
+    csv_files = get_file_paths()
+    if csv_files:
+        metric = input("Enter the metric to compare (e.g. %usr, %sys, %idle) [Default: %usr]: ").strip() or "%usr"
+        try:
+            grid = int(input("Enter the common grid in seconds [Default: 5]: ").strip() or 5)
+        except ValueError:
+            print("Invalid input. Using a 5 second grid.")
+            grid = 5
+        if grid <= 0:
+            print("The grid must be at least 1 second. Using a 5 second grid.")
+            grid = 5
+        agg = input(f"Enter the aggregation ({'/'.join(AGGREGATIONS)}) [Default: mean]: ").strip().lower() or "mean"
+        if agg not in AGGREGATIONS:
+            print("Invalid aggregation. Using mean.")
+            agg = "mean"
+
+        with stage('load', metric=metric, files=len(csv_files)):
+            df = load_interval_data(csv_files, [metric])
+        if df.empty:
+            print("No per-interval data found.")
+        else:
+            with stage('resample', grid=grid, agg=agg):
+                aligned = align_runs(resample_runs(df, [metric], grid, agg), metric)
+
+            output_dir = "mpstat_plots"
+            os.makedirs(output_dir, exist_ok=True)
+            safe_metric = metric.replace('%', 'pct_')
+            pdf_path = os.path.join(output_dir, f'{safe_metric}_aligned.pdf')
+            # Shade the incidents of a previous sysstat_anomaly.py run
+            incidents = load_incidents(os.path.join(output_dir, "incidents.csv"))
+            if not incidents.empty:
+                print(f"Annotating {len(incidents)} incidents from {os.path.join(output_dir, 'incidents.csv')}")
+            with stage('render', metric=metric):
+                plot_overlay(aligned, metric, grid, agg, pdf_path, incidents if not incidents.empty else None)
+            print(f"Aligned comparison saved to {pdf_path}")
+
+            # Sample-by-sample difference against the first file
+            baseline = aligned.columns[0]
+            if len(aligned.columns) > 1:
+                diff_path = os.path.join(output_dir, f'{safe_metric}_diff_vs_{os.path.splitext(baseline)[0]}.csv')
+                diff_runs(aligned, baseline).to_csv(diff_path)
+                print(f"Differences against {baseline} saved to {diff_path}")
@@ -0,0 +1,134 @@
+import pandas as pd
+import matplotlib.pyplot as plt
+import seaborn as sns
+from matplotlib.backends.backend_pdf import PdfPages
+import os
+from mpstat_plot import get_file_paths, load_and_extract_cpu_data
+from run_metadata import read_run_metadata, read_cpu_topology
+from stage_timing import stage
+
+# Rollup levels, coarsest first. 'core' is (socket, core_id); 'smt' is the hyperthread sibling group.
+LEVELS = ['socket', 'node', 'llc', 'core', 'smt', 'cpu']
+# Path followed when drilling down from the node level
+DRILL_PATH = ['node', 'llc', 'smt', 'cpu']
+
+# Function to build a (File, CPU) -> topology table from each CSV's run metadata
+def load_topology(csv_files):
+    frames = []
+    for file in csv_files:
+        topology = read_run_metadata(file).get('topology')
+        if not topology:
+            print(f"Warning: No topology recorded for {file}. Using this host's /sys topology.")
+            topology = read_cpu_topology()
+        if not topology:
+            continue
+        topo_df = pd.DataFrame(topology)
+        topo_df['File'] = file.split('/')[-1]
+        frames.append(topo_df)
+
+    if not frames:
+        return pd.DataFrame()
+
+    topo_df = pd.concat(frames, ignore_index=True)
+    topo_df['CPU'] = topo_df['cpu'].astype(str)
+    topo_df['core'] = topo_df['socket'].astype(str) + ':' + topo_df['core'].astype(str)
+    topo_df['cpu'] = topo_df['CPU']
+    for level in ['socket', 'node']:
+        topo_df[level] = topo_df[level].astype(str)
+    return topo_df[['File', 'CPU'] + LEVELS]
+
+# Function to attach topology columns to the per-CPU rows (the 'all' row is dropped)
+def attach_topology(df, topo_df):
+    per_cpu = df[df['CPU'] != 'all']
+    return per_cpu.merge(topo_df, on=['File', 'CPU'], how='inner')
+
+# Function to aggregate a metric per topology group
+def rollup(df, metric_column, level):
+    grouped = df.groupby(['File', level], sort=False)[metric_column]
+    result = grouped.agg(['mean', 'min', 'max', 'count']).reset_index()
+    result['spread'] = result['max'] - result['min']
+    return result
+
+# Function to walk node -> llc -> smt -> cpu, descending only into groups whose CPUs are imbalanced
+def drill_down(df, metric_column, imbalance):
+    findings = []
+    frontier = [(df, 'node', None)]
+
+    while frontier:
+        part, level, label = frontier.pop(0)
+        depth = DRILL_PATH.index(level)
+        summary = rollup(part, metric_column, level)
+        findings.append((level, label, summary))
+
+        if depth + 1 >= len(DRILL_PATH):
+            continue
+        for (file_name, group), group_df in part.groupby(['File', level], sort=False):
+            # Skip levels where the group has a single child (e.g. one LLC per node)
+            for child_level in DRILL_PATH[depth + 1:]:
+                children = group_df.groupby(child_level)[metric_column].mean()
+                if len(children) > 1:
+                    break
+            spread = group_df[metric_column].max() - group_df[metric_column].min()
+            if len(children) > 1 and spread >= imbalance:
+                frontier.append((group_df, child_level, f'{level} {group} ({file_name})'))
+
+    return findings
+
+# Function to draw one bar chart per drill-down step
+def plot_findings(findings, metric_name, pdf_path):
+    colors = sns.color_palette("Set2")
+    with PdfPages(pdf_path) as pdf:
+        for level, label, summary in findings:
+            fig, ax = plt.subplots(figsize=(11, 8.5))
+            table = summary.pivot_table(index=level, columns='File', values='mean', sort=False)
+            table.plot.bar(ax=ax, color=colors[:len(table.columns)], width=0.8)
+            ax.set_title(f'{metric_name} per {level}' + (f' within {label}' if label else ''))
+            ax.set_xlabel(level)
+            ax.set_ylabel(metric_name)
+            ax.set_facecolor('#f0f0f0')
+            ax.grid(axis='y', linestyle='--', color='white', linewidth=0.7)
+            ax.tick_params(axis='x', rotation=45)
+            ax.legend(title='CSV files')
+            plt.tight_layout()
+            pdf.savefig(fig)
+            plt.close(fig)
+
+if __name__ == "__main__":
+    csv_files = get_file_paths()
+    if csv_files:
+        metric = input("Enter the metric to roll up (e.g. busy, %usr, %sys) [Default: busy]: ").strip() or "busy"
+        try:
+            imbalance = float(input("Enter the spread (percentage points) that counts as imbalance [Default: 10]: ").strip() or 10)
+        except ValueError:
+            print("Invalid input. Using default imbalance of 10.")
+            imbalance = 10.0
+
+        # 'busy' is everything but idle
+        source_metric = '%idle' if metric == 'busy' else metric
+        with stage('load', metric=metric, files=len(csv_files)):
+            df = load_and_extract_cpu_data(csv_files, source_metric)
+            topo_df = load_topology(csv_files)
+
+        if df.empty or topo_df.empty:
+            print("No per-CPU data with topology to roll up.")
+        else:
+            if metric == 'busy':
+                df = df.assign(busy=100 - df['%idle'])
+            df = attach_topology(df, topo_df)
+
+            with stage('rollup', metric=metric):
+                for level in ['socket', 'node']:
+                    print(f"\n{metric} per {level}:")
+                    print(rollup(df, metric, level).to_string(index=False))
+                findings = drill_down(df, metric, imbalance)
+
+            for level, label, summary in findings[1:]:
+                print(f"\nImbalance within {label}, {metric} per {level}:")
+                print(summary.to_string(index=False))
+
+            output_dir = "mpstat_plots"
+            os.makedirs(output_dir, exist_ok=True)
+            pdf_path = os.path.join(output_dir, "topology_rollup.pdf")
+            with stage('render', metric=metric):
+                plot_findings(findings, metric, pdf_path)
+            print(f"Topology rollup saved to {pdf_path}")
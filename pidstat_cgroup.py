@@ -0,0 +1,155 @@
+import matplotlib.pyplot as plt
+import numpy as np
+import pandas as pd
+import os
+from sysstat_query import resolve_paths, load_pidstat
+from run_metadata import read_run_metadata
+from stage_timing import stage
+
+ROLLUP_LEVELS = ['cgroup', 'container', 'pod']
+ROLLUP_COLUMNS = ['Level', 'Name', 'Processes', 'Threads', '%CPU', 'CPUs', 'Limit CPUs', '% of limit',
+                  'Throttled %', 'Throttled s']
+
+# Function to measure how many seconds a run covers, to weight its average when runs are combined
+def run_seconds(file, metadata):
+    if metadata.get('count') and metadata.get('interval'):
+        return metadata['interval'] * metadata['count']
+    # Adaptive captures and daemon segments: the interval rows, each lasting its own Interval
+    intervals = load_pidstat(file, metrics=['%CPU'], summary_only=False)
+    if intervals.empty:
+        return 1
+    seconds = intervals.drop_duplicates('Epoch')['Interval'].fillna(metadata.get('interval') or 1).sum()
+    return seconds if seconds > 0 else 1
+
+# Function to load the 'Average:' CPU use of every captured process with its cgroup from the run metadata
+def load_process_usage(paths):
+    """One row per captured process (host, PID) with its cgroup, usage and throttling.
+
+    Several runs of the same process (e.g. the segments of a daemon capture) are
+    combined into a time-weighted average, so they are not counted as separate processes.
+    """
+    records = []
+    for file in resolve_paths(paths, exclude=('_metrics', '_placement')):
+        metadata = read_run_metadata(file)
+        cgroup = metadata.get('cgroup')
+        if not cgroup:
+            continue
+        averages = load_pidstat(file, metrics=['%CPU'])
+        if averages.empty:
+            continue
+
+        # The process row is the sum of its threads; fall back to the thread rows when it was filtered out
+        processes = averages[averages['TGID'].notnull()]
+        cpu_stat = cgroup.get('cpu_stat') or {}
+        records.append({
+            'File': file,
+            'Host': metadata.get('host'),
+            'PID': metadata.get('pid', file),
+            'Seconds': run_seconds(file, metadata),
+            'cgroup': cgroup['path'],
+            'container': (cgroup.get('container') or '')[:12] or None,
+            'pod': cgroup.get('pod'),
+            'Threads': int(averages['TGID'].isnull().sum()),
+            '%CPU': (processes if not processes.empty else averages)['%CPU'].sum(),
+            'Limit CPUs': cgroup.get('limit_cpus'),
+            'nr_periods': cpu_stat.get('nr_periods'),
+            'nr_throttled': cpu_stat.get('nr_throttled'),
+            'Throttled s': cpu_stat.get('throttled_s'),
+        })
+    if not records:
+        return pd.DataFrame()
+
+    runs = pd.DataFrame(records)
+    runs['CPU seconds'] = runs['%CPU'] * runs['Seconds']
+    usage = runs.groupby(['Host', 'PID'], dropna=False).agg(
+        {'File': 'first', 'Seconds': 'sum', 'CPU seconds': 'sum', 'cgroup': 'last', 'container': 'last', 'pod': 'last',
+         'Threads': 'max', 'Limit CPUs': 'last', 'nr_periods': lambda s: s.sum(min_count=1),
+         'nr_throttled': lambda s: s.sum(min_count=1), 'Throttled s': lambda s: s.sum(min_count=1)}).reset_index()
+    usage['%CPU'] = usage['CPU seconds'] / usage['Seconds']
+    return usage.drop(columns=['CPU seconds'])
+
+# Function to roll process usage up per cgroup, container and pod
+def rollup(usage):
+    """One row per cgroup, container and pod: summed usage next to the limit and throttling.
+
+    Processes are summed as if captured over the same period. Each cgroup's limit and
+    throttling counters are counted once, however many of its processes were captured.
+    """
+    frames = []
+    # One set of cpu.stat counters per cgroup, whichever of its runs recorded them
+    per_cgroup = usage.groupby('cgroup').agg({'container': 'first', 'pod': 'first', 'Limit CPUs': 'first',
+                                              'nr_periods': 'max', 'nr_throttled': 'max', 'Throttled s': 'max'}).reset_index()
+    for level in ROLLUP_LEVELS:
+        present = usage[usage[level].notnull()]
+        if present.empty:
+            continue
+        totals = present.groupby(level).agg(Processes=('File', 'count'), Threads=('Threads', 'sum'), **{'%CPU': ('%CPU', 'sum')})
+        limits = per_cgroup[per_cgroup[level].notnull()].groupby(level).agg(
+            {'Limit CPUs': lambda s: s.sum(min_count=1), 'nr_periods': 'sum', 'nr_throttled': 'sum',
+             'Throttled s': lambda s: s.sum(min_count=1)})
+        frame = totals.join(limits)
+        frame['Level'] = level
+        frame['Name'] = frame.index
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=ROLLUP_COLUMNS)
+
+    result = pd.concat(frames, ignore_index=True)
+    result['CPUs'] = result['%CPU'] / 100
+    result['% of limit'] = 100 * result['CPUs'] / result['Limit CPUs']
+    result['Throttled %'] = 100 * result['nr_throttled'] / result['nr_periods'].where(result['nr_periods'] > 0)
+    return result[ROLLUP_COLUMNS].sort_values(['Level', 'CPUs'], ascending=[True, False], kind='stable')
+
+# Function to plot usage against the limit and the throttled share of periods, per rollup level
+def plot_rollup(result, pdf_path, top=20):
+    levels = [level for level in ROLLUP_LEVELS if (result['Level'] == level).any()]
+    fig, axs = plt.subplots(len(levels), 2, figsize=(11, 4 * len(levels)), squeeze=False)
+    fig.suptitle('CPU use and throttling by cgroup', fontsize=16)
+
+    for row, level in zip(axs, levels):
+        data = result[result['Level'] == level].head(top).iloc[::-1]
+        names = [name if len(name) <= 40 else '...' + name[-37:] for name in data['Name']]
+        positions = np.arange(len(data))
+
+        row[0].barh(positions, data['CPUs'], color='#66c2a5')
+        row[0].scatter(data['Limit CPUs'], positions, marker='|', s=200, color='#d53e4f', label='Limit', zorder=3)
+        row[0].set_yticks(positions, names, fontsize=7)
+        row[0].set_xlabel('CPUs')
+        row[0].set_title(f'Usage per {level}')
+        row[0].legend(loc='lower right', fontsize=8)
+
+        row[1].barh(positions, data['Throttled %'].fillna(0), color='#fc8d62')
+        row[1].set_yticks(positions, [''] * len(positions))
+        row[1].set_xlabel('Throttled periods (%)')
+        row[1].set_title(f'Throttling per {level}')
+        for ax in row:
+            ax.set_facecolor('#f0f0f0')
+            ax.grid(axis='x', linestyle='--', color='white', linewidth=0.7)
+
+    plt.tight_layout()
+    fig.savefig(pdf_path)
+    plt.close(fig)
+
+def main():
+    paths = input("Enter pidstat CSV files or directories (comma separated) [Default: pidstat_data]: ").strip() or "pidstat_data"
+    with stage('load', tool='pidstat'):
+        usage = load_process_usage(paths)
+    if usage.empty:
+        print("No pidstat runs with a recorded cgroup found. Capture them with pidstat_csv.py.")
+        return
+
+    with stage('rollup', runs=len(usage)):
+        result = rollup(usage)
+    print(result.round(2).to_string(index=False))
+
+    output_dir = "pidstat_command_plots"
+    os.makedirs(output_dir, exist_ok=True)
+    rollup_csv = os.path.join(output_dir, "cgroup_rollup.csv")
+    result.round(3).to_csv(rollup_csv, index=False)
+    print(f"Rollup saved to {rollup_csv}")
+    pdf_path = os.path.join(output_dir, "cgroup_rollup.pdf")
+    plot_rollup(result, pdf_path)
+    print(f"Plot saved to {pdf_path}")
+
+if __name__ == "__main__":
+    main()
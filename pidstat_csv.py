@@ -1,6 +1,325 @@
 import subprocess
 import csv
 import os
+import re
+import threading
+import time
+from stage_timing import stage
+from sysstat_time import ReportClock, split_timestamp, sysstat_env
+from segment_store import run_daemon, run_collector, get_daemon_input
+from adaptive_sampling import get_adaptive_input, run_adaptive, weighted_average_rows
+from sysstat_exporter import get_exporter_input, run_exporter
+from run_metadata import (measure_children, measure_self, collector_metadata, write_run_metadata,
+                          read_cgroup, read_cgroup_cpu_stat, cgroup_metadata)
+
+# Column layout of the rows written by this script (pidstat -t CPU report)
+PIDSTAT_COLUMNS = ['Timestamp', 'UID', 'TGID', 'TID', '%usr', '%system', '%guest', '%wait', '%CPU', 'CPU', 'Command', 'Epoch']
+
+# Metric columns of each pidstat report, in the order they appear in the unified metrics CSV
+PIDSTAT_REPORTS = {
+    'u': ['%usr', '%system', '%guest', '%wait', '%CPU', 'CPU'],
+    'r': ['minflt/s', 'majflt/s', 'VSZ', 'RSS', '%MEM'],
+    'd': ['kB_rd/s', 'kB_wr/s', 'kB_ccwr/s', 'iodelay'],
+    'w': ['cswch/s', 'nvcswch/s'],
+}
+METRICS_KEY_COLUMNS = ['Timestamp', 'Epoch', 'UID', 'TGID', 'TID', 'Command']
+
+def make_row_filter(header=None, threshold=None, command_pattern=None, tids=None):
+    """Build a predicate over pidstat CSV rows, or None when no filter is requested.
+
+    Only data rows are tested: a row whose %CPU field is not numeric (header
+    rows, malformed lines) always passes so the file layout is preserved.
+    """
+    if threshold is None and not command_pattern and not tids:
+        return None
+
+    header = header or PIDSTAT_COLUMNS
+    cpu_idx = header.index('%CPU')
+    command_idx = header.index('Command')
+    tid_indices = [header.index(col) for col in ('TGID', 'TID', 'UID')]
+    command_re = re.compile(command_pattern) if command_pattern else None
+    tids = {str(tid) for tid in tids} if tids else None
+
+    def row_filter(row):
+        if len(row) <= command_idx:
+            return True
+        try:
+            cpu_value = float(row[cpu_idx])
+        except ValueError:
+            return True
+
+        if threshold is not None and cpu_value < threshold:
+            return False
+        if command_re and not command_re.search(row[command_idx].strip().replace("|__", "", 1)):
+            return False
+        if tids is not None:
+            # Same precedence as the loader: TGID for process rows, TID for thread rows
+            tid = next((row[i] for i in tid_indices if row[i].isdigit()), None)
+            if tid not in tids:
+                return False
+        return True
+
+    return row_filter
+
+def _join_command(columns):
+    """Rejoin the trailing fields of a data row into one Command field ('|__C2 CompilerThre')."""
+    command_index = next((i for i, val in enumerate(columns) if val.isalpha() or val.startswith("|__")), len(columns) - 1)
+    return columns[:command_index] + [" ".join(columns[command_index:]).replace(",", " ")]
+
+def parse_pidstat_output(pidstat_output, row_filter=None):
+    """Split raw 'pidstat -t' output into CSV rows, dropping rows rejected by row_filter.
+
+    Only the CPU report is kept; the -r/-d/-w reports go through parse_pidstat_metrics().
+    """
+    rows = []
+    in_cpu_report = True
+    clock = ReportClock()
+
+    for line in pidstat_output.splitlines():
+        if "Linux" in line:
+            clock.feed_header(line)  # Report date, used for the Epoch column
+            continue
+
+        columns = line.split()
+        time_fields = split_timestamp(columns)
+        if time_fields:
+            # Header rows and the other reports get no epoch but may be the last rows before midnight
+            clock.observe(" ".join(columns[:time_fields]))
+
+        if "UID" in line and "Command" in line:
+            in_cpu_report = "%CPU" in line
+        if not in_cpu_report:
+            continue
+
+        if line.startswith("Average:"):
+            row = columns + ["Epoch"] if "UID" in line else _join_command(columns) + [""]
+            if row_filter is None or row_filter(row):
+                rows.append(row)
+            continue
+
+        if line:
+            if not time_fields:
+                continue
+            timestamp = " ".join(columns[:time_fields])
+            columns = [timestamp] + columns[time_fields:]
+
+            if "UID" in line and "Command" in line:
+                columns[0] = "Timestamp"
+                rows.append(columns + ["Epoch"])
+                continue
+
+            row = _join_command(columns) + [clock.epoch(timestamp)]
+            if row_filter is None or row_filter(row):
+                rows.append(row)
+
+    return rows
+
+def parse_pidstat_metrics(pidstat_output, reports):
+    """Merge the per-thread rows of several pidstat reports into one wide table.
+
+    Rows are keyed by (Timestamp, TGID, TID); the header is METRICS_KEY_COLUMNS
+    followed by the columns of each report in 'reports' (e.g. 'urdw').
+    Metrics a report did not print for a row are left empty.
+    """
+    metric_columns = [col for report in reports for col in PIDSTAT_REPORTS[report]]
+    header = METRICS_KEY_COLUMNS + metric_columns
+    merged = {}
+    columns = None
+    clock = ReportClock()
+
+    for line in pidstat_output.splitlines():
+        fields = line.split()
+        if not fields:
+            continue
+
+        time_fields = split_timestamp(fields)
+        if fields[0] == "Linux":
+            clock.feed_header(line)
+            continue
+        elif time_fields:
+            timestamp = " ".join(fields[:time_fields])
+            fields = fields[time_fields:]
+            clock.observe(timestamp)  # Header rows get no epoch but may be the last rows before midnight
+        elif fields[0] == "Average:":
+            timestamp = "Average:"
+            fields = fields[1:]
+        else:
+            continue
+
+        if "UID" in fields and "Command" in fields:
+            columns = fields
+            continue
+        if columns is None or len(fields) < len(columns):
+            continue
+
+        # Command is the last column and may contain spaces
+        values = dict(zip(columns[:-1], fields[:len(columns) - 1]))
+        command = " ".join(fields[len(columns) - 1:]).replace(",", " ")
+        key = (timestamp, values.get('TGID'), values.get('TID'))
+
+        row = merged.get(key)
+        if row is None:
+            epoch = "" if timestamp == "Average:" else clock.epoch(timestamp)
+            row = merged[key] = {'Timestamp': timestamp, 'Epoch': epoch, 'UID': values.get('UID'),
+                                 'TGID': values.get('TGID'), 'TID': values.get('TID'), 'Command': command}
+        for col in metric_columns:
+            if col in values:
+                row[col] = values[col]
+
+    return [header] + [[row.get(col, '') for col in header] for row in merged.values()]
+
+def run_pidstat_daemon(pid, interval, min_cpu):
+    """Capture the CPU report of one PID in rotating segments under pidstat_data/pid_<pid>_segments."""
+    daemon_settings = get_daemon_input()
+    if daemon_settings is None:
+        return
+    segment_seconds, max_age_seconds, max_bytes = daemon_settings
+    row_filter = make_row_filter(threshold=min_cpu)
+
+    def capture_segment(seconds):
+        command = ["pidstat", "-t", "-p", str(pid), str(interval), str(max(1, seconds // interval))]
+        return parse_pidstat_output(run_collector(command, sysstat_env()), row_filter)
+
+    output_dir = os.path.join("pidstat_data", f"pid_{pid}_segments")
+    run_daemon(f"pid_{pid}", capture_segment, output_dir, segment_seconds, max_age_seconds, max_bytes,
+               {'pid': pid, 'interval': interval, 'min_cpu': min_cpu, 'cgroup': cgroup_metadata(read_cgroup(pid))})
+
+def read_thread_cpus(pid, proc_root="/proc"):
+    """{tid: CPU the thread last ran on}, from field 39 of /proc/<pid>/task/<tid>/stat."""
+    cpus = {}
+    task_dir = os.path.join(proc_root, str(pid), "task")
+    try:
+        tids = os.listdir(task_dir)
+    except OSError:
+        return cpus
+
+    for tid in tids:
+        try:
+            with open(os.path.join(task_dir, tid, "stat")) as stat_file:
+                stat = stat_file.read()
+        except OSError:
+            continue  # The thread exited
+        # The command (field 2) may contain spaces and parentheses, so count fields from the last ')'
+        fields = stat[stat.rindex(")") + 2:].split()
+        cpus[int(tid)] = int(fields[39 - 3])
+    return cpus
+
+def sample_thread_placement(pid, interval, stop):
+    """Rows of (Epoch, TID, CPU) read from /proc every interval seconds until 'stop' is set."""
+    rows = [['Epoch', 'TID', 'CPU']]
+    next_sample = time.time() + interval
+    while not stop.wait(max(0, next_sample - time.time())):
+        epoch = int(time.time())
+        rows += [[epoch, tid, cpu] for tid, cpu in sorted(read_thread_cpus(pid).items())]
+        next_sample += interval
+    return rows
+
+def capture_pidstat_sample(pid, interval, row_filter=None):
+    """One 'pidstat -t interval 1' sample: (header, thread rows, busiest thread's %CPU)."""
+    command = ["pidstat", "-t", "-p", str(pid), str(interval), "1"]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=sysstat_env())
+    parsed = parse_pidstat_output(result.stdout, row_filter)
+    if not parsed:
+        return None, [], None
+    header = parsed[0]
+    cpu_idx, tid_idx = header.index('%CPU'), header.index('TID')
+    rows = [row for row in parsed[1:] if row[0] not in ('Timestamp', 'Average:')]
+    # Thread rows only: the process row would trip the threshold on the sum of its threads
+    busy = [float(row[cpu_idx]) for row in rows if row[tid_idx].isdigit()]
+    return header, rows, max(busy, default=None)
+
+def run_pidstat_adaptive(pid, interval, min_cpu, throttling=False):
+    """Capture the CPU report of one PID, switching to a fine interval while a thread is busy."""
+    settings = get_adaptive_input(interval)
+    if settings is None:
+        return
+    cgroup = read_cgroup(pid)
+    cpu_stat_before = read_cgroup_cpu_stat(cgroup) if throttling else None
+
+    with stage('capture', mode='adaptive', duration=settings['duration']):
+        with measure_children() as sysstat_usage:
+            with measure_self() as parser_usage:
+                rows, switches = run_adaptive(lambda seconds: capture_pidstat_sample(pid, seconds), **settings)
+    if not rows:
+        print("No samples captured.")
+        return
+
+    output_dir = "pidstat_data"
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, f'pid_{pid}_info.csv')
+    # Average over every sample, then apply min_cpu to interval and average rows alike,
+    # as pidstat's own Average rows are filtered in the fixed-interval capture
+    averages = weighted_average_rows(rows, ['UID', 'TGID', 'TID', 'Command'], PIDSTAT_REPORTS['u'][:-1])
+    row_filter = make_row_filter(rows[0], threshold=min_cpu)
+    if row_filter:
+        rows = [rows[0]] + [row for row in rows[1:] if row_filter(row)]
+        averages = [averages[0]] + [row for row in averages[1:] if row_filter(row)]
+    with stage('write', rows=len(rows)):
+        with open(file_path, 'w', newline='') as file:
+            csv.writer(file).writerows(rows + averages)
+
+    write_run_metadata(file_path, {
+        'tool': 'pidstat',
+        'pid': pid,
+        'interval': interval,
+        'min_cpu': min_cpu,
+        'reports': "u",
+        'adaptive': dict(settings, switches=switches),
+        'collector': collector_metadata(sysstat_usage, parser_usage),
+        'cgroup': cgroup_metadata(cgroup, cpu_stat_before),
+    })
+    print(f"Switched interval {len(switches)} times. Data saved to {file_path}")
+
+PIDSTAT_EXPORTER_FAMILIES = {
+    'pidstat_thread_cpu_percent': ('gauge', "Share of the latest interval each thread spent in each mode ('total' is %CPU)."),
+    'pidstat_thread_cpu_seconds_total': ('counter', "CPU seconds of each thread since the exporter started, per mode."),
+    'pidstat_thread_last_cpu': ('gauge', "CPU each thread last ran on."),
+}
+
+def pidstat_exporter_metrics(pid):
+    """Turns one 'pidstat -t' sample into per-thread gauges and counter increments."""
+    def to_metrics(header, rows, interval):
+        tid_idx, command_idx = header.index('TID'), header.index('Command')
+        cpu_idx = header.index('CPU') if 'CPU' in header else None
+        metric_idx = [(header.index(col), col[1:]) for col in PIDSTAT_REPORTS['u'][:-2] if col in header]
+        total_idx = header.index('%CPU')
+        gauges, increments = {}, {}
+        # Thread rows only; the process row is the sum of its threads
+        for row in rows:
+            if not row[tid_idx].isdigit():
+                continue
+            thread = (('pid', pid), ('tid', row[tid_idx]), ('command', row[command_idx].replace('|__', '', 1)))
+            for i, mode in metric_idx:
+                value = float(row[i])
+                gauges[('pidstat_thread_cpu_percent', thread + (('mode', mode),))] = value
+                if mode != 'wait':  # %wait is time spent runnable but not running, not CPU time
+                    increments[('pidstat_thread_cpu_seconds_total', thread + (('mode', mode),))] = value / 100 * interval
+            gauges[('pidstat_thread_cpu_percent', thread + (('mode', 'total'),))] = float(row[total_idx])
+            if cpu_idx is not None and row[cpu_idx].isdigit():
+                gauges[('pidstat_thread_last_cpu', thread)] = float(row[cpu_idx])
+        return gauges, increments
+    return to_metrics
+
+def live_thread_series(pid, proc_root="/proc"):
+    """keep_series for the exporter: the keys whose thread is still listed in /proc/<pid>/task.
+
+    A thread that drops under min_cpu keeps its counters; they are dropped once it exits.
+    """
+    def keep_series(keys):
+        try:
+            tids = set(os.listdir(os.path.join(proc_root, str(pid), "task")))
+        except OSError:
+            return []  # The process exited
+        return [key for key in keys if dict(key[1]).get('tid') in tids]
+    return keep_series
+
+def run_pidstat_exporter(pid, interval, min_cpu):
+    address, port = get_exporter_input()
+    if port is None:
+        return
+    row_filter = make_row_filter(threshold=min_cpu)
+    run_exporter(lambda seconds: capture_pidstat_sample(pid, seconds, row_filter), pidstat_exporter_metrics(pid),
+                 PIDSTAT_EXPORTER_FAMILIES, interval, address, port, live_thread_series(pid))
 
 def capture_pidstat_data():
     pid = input("Enter the PID to monitor: ")
@@ -19,52 +338,104 @@ def capture_pidstat_data():
         return
 
     interval = input("Enter the interval in seconds (default 1): ")
-    count = input("Enter the number of times to repeat (default 5): ")
+    count = input("Enter the number of times to repeat (default 5, 'daemon' to capture continuously, "
+                  "'adaptive' to switch to a fine interval while a thread is busy, "
+                  "or 'exporter' to serve live metrics over HTTP): ").strip()
+    min_cpu = input("Enter the minimum %CPU for a thread row to be recorded (default: record all): ").strip()
+    extra_reports = input("Extra per-thread reports, any of r (memory), d (I/O), w (context switches), "
+                          "p (last-run CPU from /proc, for pidstat builds without a CPU column), "
+                          "c (cgroup cpu.stat throttling) (default: none): ")
+    placement = "p" in extra_reports.lower()
+    throttling = "c" in extra_reports.lower()
+    extra_reports = "".join(r for r in "rdw" if r in extra_reports.lower())
 
     interval = int(interval) if interval else 1
-    count = int(count) if count else 5
+    daemon = count.lower() == "daemon"
+    adaptive = count.lower() == "adaptive"
+    exporter = count.lower() == "exporter"
+    count = 0 if daemon or adaptive or exporter else int(count) if count else 5
 
+    try:
+        min_cpu = float(min_cpu) if min_cpu else None
+    except ValueError:
+        print("Invalid %CPU threshold. Recording all rows.")
+        min_cpu = None
+
+    if daemon:
+        run_pidstat_daemon(pid, interval, min_cpu)
+        return
+    if adaptive:
+        run_pidstat_adaptive(pid, interval, min_cpu, throttling)
+        return
+    if exporter:
+        run_pidstat_exporter(pid, interval, min_cpu)
+        return
+
+    # The cgroup path is always recorded; its throttling counters are read before and after the capture
+    cgroup = read_cgroup(pid)
+    cpu_stat_before = read_cgroup_cpu_stat(cgroup) if throttling else None
     command = ["pidstat", "-t", "-p", str(pid), str(interval), str(count)]
-    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if extra_reports:
+        command[1:1] = ["-u"] + [f"-{r}" for r in extra_reports]
+    if placement:
+        # Sample /proc alongside pidstat, on the same interval
+        stop = threading.Event()
+        placement_rows = []
+        sampler = threading.Thread(target=lambda: placement_rows.extend(sample_thread_placement(pid, interval, stop)),
+                                   daemon=True)
+        sampler.start()
+    try:
+        with stage('capture', interval=interval, count=count):
+            with measure_children() as sysstat_usage:
+                result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=sysstat_env())
+    finally:
+        # Stop the sampler even when pidstat is missing or the capture is interrupted
+        if placement:
+            stop.set()
+            sampler.join()
 
     pidstat_output = result.stdout
+    with stage('parse'):
+        with measure_self() as parser_usage:
+            rows = parse_pidstat_output(pidstat_output, make_row_filter(threshold=min_cpu))
+            if extra_reports:
+                metrics_rows = parse_pidstat_metrics(pidstat_output, "u" + extra_reports)
+                metrics_filter = make_row_filter(metrics_rows[0], threshold=min_cpu)
+                if metrics_filter:
+                    metrics_rows = [metrics_rows[0]] + [row for row in metrics_rows[1:] if metrics_filter(row)]
 
     output_dir = "pidstat_data"
     os.makedirs(output_dir, exist_ok=True)
 
     file_path = os.path.join(output_dir, f'pid_{pid}_info.csv')
 
-    with open(file_path, 'w', newline='') as file:
-        writer = csv.writer(file, delimiter=',')
+    with stage('write', rows=len(rows)):
+        with open(file_path, 'w', newline='') as file:
+            writer = csv.writer(file, delimiter=',')
+            writer.writerows(rows)
+        if extra_reports:
+            metrics_path = os.path.join(output_dir, f'pid_{pid}_metrics.csv')
+            with open(metrics_path, 'w', newline='') as file:
+                csv.writer(file).writerows(metrics_rows)
+            print(f"Per-thread metrics saved to {metrics_path}")
+        if placement:
+            placement_path = os.path.join(output_dir, f'pid_{pid}_placement.csv')
+            with open(placement_path, 'w', newline='') as file:
+                csv.writer(file).writerows(placement_rows)
+            print(f"Thread placement saved to {placement_path}")
 
-        for line in pidstat_output.splitlines():
-            if "Linux" in line:
-                continue
-
-            if line.startswith("Average:"):
-                row = line.split()
-                writer.writerow(row)
-                continue
-
-            if line:
-                columns = line.split()
-                timestamp = columns[0] + " " + columns[1]
-                columns[0] = timestamp
-                del columns[1]
-
-                if "UID" in line and "Command" in line:
-                    columns[0] = "Timestamp"
-                    writer.writerow(columns)
-                    continue
-
-                command_index = next((i for i, val in enumerate(columns) if val.isalpha() or val.startswith("|__")), len(columns) - 1)
-                normal_columns = columns[:command_index]
-                command_column = " ".join(columns[command_index:]).replace(",", " ")
-                writer.writerow(normal_columns + [command_column])
+    write_run_metadata(file_path, {
+        'tool': 'pidstat',
+        'pid': pid,
+        'interval': interval,
+        'count': count,
+        'min_cpu': min_cpu,
+        'reports': "u" + extra_reports,
+        'collector': collector_metadata(sysstat_usage, parser_usage),
+        'cgroup': cgroup_metadata(cgroup, cpu_stat_before),
+    })
 
     print(f"Data successfully saved to {file_path}")
 
 if __name__ == "__main__":
     capture_pidstat_data()
-
-
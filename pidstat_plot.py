@@ -4,7 +4,12 @@ import seaborn as sns
 import pandas as pd
 import os
 import re
+import math
+import numpy as np
 import PyPDF2
+from pidstat_csv import PIDSTAT_REPORTS
+from sysstat_query import load_pidstat
+from stage_timing import stage
 
 def merge_pdfs(pdf_files, output_pdf):
     pdf_writer = PyPDF2.PdfWriter()
@@ -19,115 +24,133 @@ def merge_pdfs(pdf_files, output_pdf):
         pdf_writer.write(out_file)
     print(f"Merged PDF saved as {output_pdf}")
 
-def load_and_extract_cpu_data(files):
-    data_frames = []
-    for file in files:
-        try:
-            columns = ['Timestamp', 'CPU', 'TID_1', 'TID_2', '%usr', '%system', '%guest', '%wait', '%CPU', 'Dash', 'Command']
-            df = pd.read_csv(file, header=None, names=columns, on_bad_lines='skip')
-            df.columns = df.columns.str.strip()
-            df_filtered = df[df['Timestamp'].astype(str).str.strip().str.lower() == 'average:'].copy()
-
-            def extract_tid(row):
-                for col in ['TID_1', 'TID_2', 'CPU']:
-                    if str(row[col]).isdigit():
-                        return int(row[col])
-                return None
-
-            df_filtered['TID'] = df_filtered.apply(extract_tid, axis=1)
-            df_filtered = df_filtered[df_filtered['TID'].notnull()]
-            df_filtered['TID'] = df_filtered['TID'].astype(int)
-            df_filtered['Command'] = df_filtered['Command'].astype(str).str.strip()
-            df_filtered['File'] = os.path.basename(file)
-
-            for col in ['%usr', '%system', '%guest', '%wait', '%CPU']:
-                if col in df_filtered.columns:
-                    df_filtered[col] = pd.to_numeric(df_filtered[col], errors='coerce')
-
-            # Create a label like "TID 12345 (file.csv)"
-            df_filtered['Label'] = df_filtered.apply(lambda row: f"TID {row['TID']} ({row['File']})", axis=1)
-
-            data_frames.append(df_filtered)
-
-        except Exception as e:
-            print(f"Error processing {file}: {e}")
-
-    if not data_frames:
+# Metrics plotted for each choice of the metric set prompt
+METRIC_SETS = {
+    'cpu': ['%usr', '%system', '%guest', '%wait', '%CPU'],
+    'memory': ['minflt/s', 'majflt/s', 'RSS', '%MEM'],
+    'io': ['kB_rd/s', 'kB_wr/s', 'kB_ccwr/s', 'iodelay'],
+    'switches': ['cswch/s', 'nvcswch/s', '%CPU'],
+}
+METRIC_SETS['all'] = ['%CPU'] + [m for report in 'rdw' for m in PIDSTAT_REPORTS[report]]
+
+def load_and_extract_cpu_data(files, threshold=None, command_pattern=None, tids=None):
+    """Load the 'Average:' thread rows, applying the filters before any DataFrame is built."""
+    df = load_pidstat(files, metrics=METRIC_SETS['cpu'], threshold=threshold, command_pattern=command_pattern, tids=tids)
+    if df.empty:
         print("No valid data found in any files.")
-        return pd.DataFrame()
+        return df
 
-    return pd.concat(data_frames, ignore_index=True)
+    # Create a label like "TID 12345 (file.csv)"
+    df['Label'] = "TID " + df['TID'].astype(str) + " (" + df['File'] + ")"
+    return df
 
-def plot_metrics_by_command(df, output_dir):
-    metrics = ['%usr', '%system', '%guest', '%wait', '%CPU']
+def load_thread_metrics(files, threshold=None, command_pattern=None, tids=None):
+    """Load the 'Average:' rows of the unified pid_<pid>_metrics.csv files as typed columns."""
+    df = load_pidstat(files, threshold=threshold, command_pattern=command_pattern, tids=tids)
+    if df.empty:
+        print("No valid data found in any files.")
+        return df
+
+    df['Label'] = "TID " + df['TID'].astype(str) + " (" + df['File'] + ")"
+    return df
+
+def classify_threads(df):
+    """Label each thread as CPU-bound, I/O-bound, lock-contended or mostly idle.
+
+    CPU-bound: high %CPU or more involuntary than voluntary switches (preempted
+    while runnable). I/O-bound: block I/O delay or disk traffic. Contended: many
+    voluntary switches (sleeping on locks or futexes) with little CPU. Columns a
+    run did not capture simply do not contribute.
+    """
+    def column(name):
+        return df[name].fillna(0) if name in df.columns else pd.Series(0.0, index=df.index)
+
+    cpu = column('%CPU')
+    voluntary = column('cswch/s')
+    involuntary = column('nvcswch/s')
+    io = column('kB_rd/s') + column('kB_wr/s')
+
+    df = df.copy()
+    df['Bound'] = np.select(
+        [(cpu >= 50) | ((involuntary > voluntary) & (cpu >= 10)),
+         (column('iodelay') > 0) | (io >= 1024),
+         voluntary >= 100],
+        ['CPU-bound', 'I/O-bound', 'contended'],
+        default='idle/mixed')
+    return df
+
+def plot_metrics_by_command(df, output_dir, metrics=None):
+    metrics = [m for m in (metrics or METRIC_SETS['cpu']) if m in df.columns]
     os.makedirs(output_dir, exist_ok=True)
     generated_pdfs = []
+    grid_rows = max(3, math.ceil(len(metrics) / 2))
 
     for command, group in df.groupby('Command'):
-        sns.set(style="whitegrid", palette="muted")
-        fig, axes = plt.subplots(3, 2, figsize=(10, 12))
-        axes = axes.flatten()
-        fig.suptitle(f'Comparison of Metrics for Command: {command}', fontsize=16)
-
-        unique_files = sorted(group['File'].unique())
-
-        for idx, metric in enumerate(metrics):
-            if idx >= len(axes):
-                continue
-            ax = axes[idx]
-            data = group[['Label', metric, 'File']].dropna()
-
-            sns.barplot(
-                data=data,
-                x='Label',
-                y=metric,
-                hue='File',
-                ax=ax,
-                dodge=False  # same label won't appear twice
+        with stage('render', command=command, threads=len(group)):
+            sns.set(style="whitegrid", palette="muted")
+            fig, axes = plt.subplots(grid_rows, 2, figsize=(10, 4 * grid_rows))
+            axes = axes.flatten()
+            fig.suptitle(f'Comparison of Metrics for Command: {command}', fontsize=16)
+
+            unique_files = sorted(group['File'].unique())
+
+            for idx, metric in enumerate(metrics):
+                if idx >= len(axes):
+                    continue
+                ax = axes[idx]
+                data = group[['Label', metric, 'File']].dropna()
+
+                sns.barplot(
+                    data=data,
+                    x='Label',
+                    y=metric,
+                    hue='File',
+                    ax=ax,
+                    dodge=False  # same label won't appear twice
+                )
+
+                # Rotate x labels for readability
+                ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
+                ax.set_title(f'{metric} Comparison', fontsize=14)
+                ax.set_xlabel('TID (File)', fontsize=12)
+                ax.set_ylabel(f'{metric} (%)' if metric.startswith('%') else metric, fontsize=12)
+
+                for p in ax.patches:
+                    if not pd.isna(p.get_height()) and p.get_height() > 0:
+                        ax.annotate(f'{p.get_height():.2f}',
+                                    (p.get_x() + p.get_width() / 2., p.get_height()),
+                                    ha='center', va='center',
+                                    fontsize=10, color='black',
+                                    xytext=(0, 5), textcoords='offset points')
+
+                y_max = data[metric].max()
+                ax.set_ylim(0, y_max * 1.2 if y_max > 0 else 1)
+
+                if ax.get_legend():
+                    ax.get_legend().remove()
+
+            # Hide unused plot
+            if len(metrics) < len(axes):
+                for j in range(len(metrics), len(axes)):
+                    axes[j].axis("off")
+
+            # Add legend only once
+            fig.legend(
+                handles=[mpatches.Patch(label=f, color=sns.color_palette()[i])
+                         for i, f in enumerate(unique_files)],
+                labels=unique_files,
+                loc='lower right',
+                bbox_to_anchor=(0.95, 0.05),
+                title="CSV files"
             )
 
-            # Rotate x labels for readability
-            ax.set_xticklabels(ax.get_xticklabels(), rotation=45, ha='right')
-            ax.set_title(f'{metric} Comparison', fontsize=14)
-            ax.set_xlabel('TID (File)', fontsize=12)
-            ax.set_ylabel(f'{metric} (%)', fontsize=12)
-
-            for p in ax.patches:
-                if not pd.isna(p.get_height()) and p.get_height() > 0:
-                    ax.annotate(f'{p.get_height():.2f}',
-                                (p.get_x() + p.get_width() / 2., p.get_height()),
-                                ha='center', va='center',
-                                fontsize=10, color='black',
-                                xytext=(0, 5), textcoords='offset points')
-
-            y_max = data[metric].max()
-            ax.set_ylim(0, y_max * 1.2 if y_max > 0 else 1)
-
-            if ax.get_legend():
-                ax.get_legend().remove()
-
-        # Hide unused plot
-        if len(metrics) < len(axes):
-            for j in range(len(metrics), len(axes)):
-                axes[j].axis("off")
-
-        # Add legend only once
-        fig.legend(
-            handles=[mpatches.Patch(label=f, color=sns.color_palette()[i])
-                     for i, f in enumerate(unique_files)],
-            labels=unique_files,
-            loc='lower right',
-            bbox_to_anchor=(0.95, 0.05),
-            title="CSV files"
-        )
-
-        safe_command = re.sub(r'[^a-zA-Z0-9_\-]', '_', command)
-        output_pdf = os.path.join(output_dir, f"{safe_command}_comparison.pdf")
-        plt.tight_layout(rect=[0, 0.05, 1, 1])
-        plt.savefig(output_pdf, format='pdf')
-        plt.close()
-        print(f"Generated: {output_pdf}")
-        generated_pdfs.append(output_pdf)
+            safe_command = re.sub(r'[^a-zA-Z0-9_\-]', '_', command)
+            output_pdf = os.path.join(output_dir, f"{safe_command}_comparison.pdf")
+            plt.tight_layout(rect=[0, 0.05, 1, 1])
+            plt.savefig(output_pdf, format='pdf')
+            plt.close()
+            print(f"Generated: {output_pdf}")
+            generated_pdfs.append(output_pdf)
 
     return generated_pdfs
 
@@ -138,6 +161,19 @@ def main():
         print("Invalid input. Using default threshold of 10%.")
         threshold = 10.0
 
+    command_pattern = input("Enter a regex to select commands (press Enter for all): ").strip() or None
+    if command_pattern:
+        try:
+            re.compile(command_pattern)
+        except re.error as e:
+            print(f"Invalid command regex: {e}")
+            return
+
+    metric_set = input(f"Metric set to plot ({'/'.join(METRIC_SETS)}) (default cpu): ").strip().lower() or "cpu"
+    if metric_set not in METRIC_SETS:
+        print(f"Unknown metric set '{metric_set}'. Using cpu.")
+        metric_set = "cpu"
+
     file_paths_input = input("Enter CSV file paths (comma separated), or press Enter to use all in 'pidstat_data/': ").strip()
     if file_paths_input:
         file_paths = [p.strip() for p in file_paths_input.split(',')]
@@ -148,25 +184,36 @@ def main():
             return
         file_paths = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".csv")]
 
+    # The CPU report lives in pid_<pid>_info.csv, the unified -u/-r/-d/-w schema in pid_<pid>_metrics.csv
+    use_metrics_files = metric_set != "cpu"
+    file_paths = [p for p in file_paths if p.endswith("_metrics.csv") == use_metrics_files and not p.endswith("_placement.csv")]
     if not file_paths:
         print("No files to process.")
         return
 
-    df = load_and_extract_cpu_data(file_paths)
+    output_dir = "pidstat_command_plots"
+    with stage('load', files=len(file_paths)):
+        if use_metrics_files:
+            df = load_thread_metrics(file_paths, threshold=threshold, command_pattern=command_pattern)
+        else:
+            df = load_and_extract_cpu_data(file_paths, threshold=threshold, command_pattern=command_pattern)
     if df.empty:
-        print("No valid data found.")
-        return
-
-    df_filtered = df[df['%CPU'] >= threshold]
-    if df_filtered.empty:
         print(f"No rows with %CPU >= {threshold}")
         return
 
-    output_dir = "pidstat_command_plots"
-    generated_pdfs = plot_metrics_by_command(df_filtered, output_dir)
+    if use_metrics_files:
+        df = classify_threads(df)
+        os.makedirs(output_dir, exist_ok=True)
+        classification_csv = os.path.join(output_dir, "thread_classification.csv")
+        df[['File', 'TID', 'Command', 'Bound'] + [m for m in METRIC_SETS['all'] if m in df.columns]].to_csv(classification_csv, index=False)
+        print(df.groupby(['File', 'Bound']).size().to_string())
+        print(f"Thread classification saved to {classification_csv}")
+
+    generated_pdfs = plot_metrics_by_command(df, output_dir, METRIC_SETS[metric_set])
 
     if generated_pdfs:
-        merge_pdfs(generated_pdfs, os.path.join(output_dir, "merged_command_comparison.pdf"))
+        with stage('merge', pdfs=len(generated_pdfs)):
+            merge_pdfs(generated_pdfs, os.path.join(output_dir, "merged_command_comparison.pdf"))
     else:
         print("No plots were generated.")
 
@@ -0,0 +1,199 @@
+import matplotlib.pyplot as plt
+import csv
+import heapq
+import os
+from pidstat_csv import PIDSTAT_COLUMNS
+from sysstat_time import ReportClock
+from sysstat_anomaly import load_incidents
+from run_metadata import read_run_metadata
+
+RANKINGS = [('peak', 'Peak %CPU'), ('mean', 'Mean %CPU'), ('sustained', 'Seconds above threshold')]
+
+def _row_epoch(row, epoch_idx):
+    # Files written before the Epoch column existed only carry the display timestamp
+    if len(row) > epoch_idx and row[epoch_idx].isdigit():
+        return int(row[epoch_idx])
+    try:
+        return ReportClock().epoch(row[0])
+    except (AttributeError, ValueError):
+        return None
+
+def _shortest_gap(file, epoch_idx):
+    """Shortest gap between consecutive timestamps of a file's thread rows, or None.
+
+    min_cpu may drop whole intervals, so the shortest gap is the sampling interval.
+    """
+    tid_idx = PIDSTAT_COLUMNS.index('TID')
+    shortest = previous = None
+    with open(file, newline='') as f:
+        for row in csv.reader(f):
+            if len(row) <= tid_idx or row[0] in ('Timestamp', 'Average:') or not row[tid_idx].isdigit():
+                continue
+            epoch = _row_epoch(row, epoch_idx)
+            if epoch is not None and previous is not None and epoch != previous:
+                gap = (epoch - previous) % 86400
+                shortest = gap if shortest is None else min(shortest, gap)
+            previous = epoch if epoch is not None else previous
+    return shortest
+
+def scan_hot_threads(files, threshold):
+    """Stream the per-interval thread rows of each file into per-thread running stats.
+
+    Memory grows with the number of distinct threads, not with the number of samples.
+    Each sample stands for its Interval (adaptive captures), else the file's interval:
+    the one in the run metadata, or else the shortest gap between consecutive timestamps.
+    Files captured with min_cpu lack the samples of quiet threads, so the mean is taken
+    over the whole run (missing samples count as idle) and a gap in a thread's samples
+    ends its streak above the threshold.
+    """
+    cpu_idx = PIDSTAT_COLUMNS.index('%CPU')
+    tid_idx = PIDSTAT_COLUMNS.index('TID')
+    command_idx = PIDSTAT_COLUMNS.index('Command')
+    epoch_idx = PIDSTAT_COLUMNS.index('Epoch')
+    stats = {}
+
+    for file in files:
+        file_name = os.path.basename(file)
+        file_stats = {}
+        metadata = read_run_metadata(file)
+        interval_idx = None
+        first_epoch = last_epoch = first_weight = None
+        try:
+            file_interval = metadata.get('interval') or _shortest_gap(file, epoch_idx) or 1
+            with open(file, newline='') as f:
+                for row in csv.reader(f):
+                    if row and row[0] == 'Timestamp' and 'Interval' in row:
+                        interval_idx = row.index('Interval')
+                    if len(row) <= command_idx or row[0] in ('Timestamp', 'Average:') or not row[tid_idx].isdigit():
+                        continue
+                    try:
+                        cpu = float(row[cpu_idx])
+                    except ValueError:
+                        continue
+
+                    weight = int(row[interval_idx]) if interval_idx is not None and row[interval_idx].isdigit() else file_interval
+                    epoch = _row_epoch(row, epoch_idx)
+                    if epoch is not None:
+                        if first_epoch is None:
+                            first_epoch, first_weight = epoch, weight
+                        last_epoch = epoch
+
+                    s = file_stats.get(row[tid_idx])
+                    if s is None:
+                        s = file_stats[row[tid_idx]] = {
+                            'tid': int(row[tid_idx]), 'file': file_name,
+                            'command': row[command_idx].strip().replace("|__", "", 1),
+                            'samples': 0, 'total': 0.0, 'peak': 0.0, 'sustained': 0, 'streak': 0,
+                            'longest_seconds': 0, 'last_epoch': None,
+                        }
+                    # A sample covers the 'weight' seconds up to its timestamp; anything earlier is a gap
+                    if epoch is not None and s['last_epoch'] is not None and (epoch - s['last_epoch']) % 86400 > weight:
+                        s['streak'] = 0
+                    s['last_epoch'] = epoch
+                    s['samples'] += 1
+                    s['total'] += cpu * weight
+                    s['peak'] = max(s['peak'], cpu)
+                    if cpu >= threshold:
+                        s['sustained'] += weight
+                        s['streak'] += weight
+                        s['longest_seconds'] = max(s['longest_seconds'], s['streak'])
+                    else:
+                        s['streak'] = 0
+        except OSError as e:
+            print(f"Error processing {file}: {e}")
+            continue
+
+        # Seconds the run covered: interval x count when known, else first to last sample
+        if metadata.get('count') and metadata.get('interval'):
+            run_seconds = metadata['interval'] * metadata['count']
+        elif first_epoch is not None:
+            run_seconds = (last_epoch - first_epoch) % 86400 + first_weight
+        else:
+            run_seconds = None
+
+        for s in file_stats.values():
+            s['mean'] = s['total'] / (run_seconds or s['samples'] * file_interval)
+            stats[(file_name, s['tid'])] = s
+
+    return stats
+
+def top_k(stats, k, key):
+    """Return the k hottest threads for one ranking, selected with a heap of k entries."""
+    return heapq.nlargest(k, stats.values(), key=lambda s: s[key])
+
+def print_report(ranked, threshold):
+    for key, title in RANKINGS:
+        print(f"\nTop threads by {title} (threshold {threshold}%):")
+        print(f"{'#':>3}  {'TID':>8}  {'Command':<20} {'Peak':>7} {'Mean':>7} {'Above(s)':>9} {'Longest(s)':>10}  File")
+        for rank, s in enumerate(ranked[key], start=1):
+            print(f"{rank:>3}  {s['tid']:>8}  {s['command'][:20]:<20} {s['peak']:>7.2f} {s['mean']:>7.2f} {s['sustained']:>9} {s['longest_seconds']:>10}  {s['file']}")
+
+def plot_hot_threads(ranked, threshold, output_pdf, incidents=None):
+    fig, axes = plt.subplots(len(RANKINGS), 1, figsize=(8.5, 11))
+    fig.suptitle(f'Hot Threads (threshold {threshold}% CPU)', fontsize=16)
+
+    for ax, (key, title) in zip(axes, RANKINGS):
+        threads = ranked[key][::-1]  # Hottest at the top
+        labels = [f"TID {s['tid']} {s['command']} ({s['file']})" for s in threads]
+        if incidents:
+            # Mark threads with incidents found by sysstat_anomaly.py
+            labels = [label + (f" [{incidents[(s['file'], str(s['tid']))]} incidents]" if (s['file'], str(s['tid'])) in incidents else "")
+                      for label, s in zip(labels, threads)]
+        values = [s[key] for s in threads]
+        bars = ax.barh(labels, values, color='#66c2a5')
+        ax.bar_label(bars, fmt='%.2f', fontsize=8, padding=2)
+        ax.set_title(title)
+        ax.set_facecolor('#f0f0f0')
+        ax.grid(axis='x', linestyle='--', color='white', linewidth=0.7)
+        ax.tick_params(axis='y', labelsize=8)
+        if values:
+            ax.set_xlim(0, max(values) * 1.15 or 1)
+
+    plt.tight_layout()
+    plt.savefig(output_pdf, format='pdf')
+    plt.close(fig)
+    print(f"Generated: {output_pdf}")
+
+def main():
+    try:
+        threshold = float(input("Enter CPU utilization threshold for sustained time (default 10%): ").strip() or 10)
+    except ValueError:
+        print("Invalid input. Using default threshold of 10%.")
+        threshold = 10.0
+
+    try:
+        k = int(input("Enter number of threads to report per ranking (default 10): ").strip() or 10)
+    except ValueError:
+        print("Invalid input. Using default of 10.")
+        k = 10
+
+    file_paths_input = input("Enter CSV file paths (comma separated), or press Enter to use all in 'pidstat_data/': ").strip()
+    if file_paths_input:
+        file_paths = [p.strip() for p in file_paths_input.split(',')]
+    else:
+        data_dir = "pidstat_data"
+        if not os.path.exists(data_dir):
+            print(f"Directory '{data_dir}' not found.")
+            return
+        file_paths = [os.path.join(data_dir, f) for f in os.listdir(data_dir) if f.endswith(".csv") and not f.endswith(("_metrics.csv", "_placement.csv"))]
+
+    if not file_paths:
+        print("No files to process.")
+        return
+
+    stats = scan_hot_threads(file_paths, threshold)
+    if not stats:
+        print("No per-interval thread rows found.")
+        return
+
+    ranked = {key: top_k(stats, k, key) for key, _ in RANKINGS}
+    print_report(ranked, threshold)
+
+    output_dir = "pidstat_command_plots"
+    os.makedirs(output_dir, exist_ok=True)
+    incidents = load_incidents(os.path.join(output_dir, "incidents.csv"))
+    incident_counts = incidents.groupby(['File', 'Key']).size().to_dict() if not incidents.empty else None
+    plot_hot_threads(ranked, threshold, os.path.join(output_dir, "hot_threads.pdf"), incident_counts)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+import json
+import os
+import re
+import resource
+import socket
+import time
+from contextlib import contextmanager
+
+def metadata_path(csv_path):
+    """Run metadata lives next to the CSV: cpu_usage.csv -> cpu_usage.meta.json"""
+    base, _ = os.path.splitext(csv_path)
+    return base + ".meta.json"
+
+def write_run_metadata(csv_path, metadata):
+    metadata = dict(metadata)
+    metadata.setdefault('host', socket.gethostname())
+    metadata.setdefault('online_cpus', os.cpu_count())
+    path = metadata_path(csv_path)
+    with open(path, 'w') as meta_file:
+        json.dump(metadata, meta_file, indent=2)
+    return path
+
+def read_run_metadata(csv_path):
+    path = metadata_path(csv_path)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path) as meta_file:
+            return json.load(meta_file)
+    except (OSError, ValueError) as e:
+        print(f"Error reading {path}: {e}")
+        return {}
+
+@contextmanager
+def measure_children():
+    """Collect CPU time and context switches of the child processes reaped inside the block.
+
+    Only valid when the block runs one collector at a time (as the capture scripts do).
+    """
+    usage = {}
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+    try:
+        yield usage
+    finally:
+        after = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage['wall_s'] = round(time.perf_counter() - wall_start, 6)
+        usage['user_s'] = round(after.ru_utime - before.ru_utime, 6)
+        usage['system_s'] = round(after.ru_stime - before.ru_stime, 6)
+        usage['voluntary_ctxsw'] = after.ru_nvcsw - before.ru_nvcsw
+        usage['involuntary_ctxsw'] = after.ru_nivcsw - before.ru_nivcsw
+
+@contextmanager
+def measure_self():
+    """Collect this process's CPU time and context switches inside the block."""
+    usage = {}
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    try:
+        yield usage
+    finally:
+        after = resource.getrusage(resource.RUSAGE_SELF)
+        usage['user_s'] = round(after.ru_utime - before.ru_utime, 6)
+        usage['system_s'] = round(after.ru_stime - before.ru_stime, 6)
+        usage['voluntary_ctxsw'] = after.ru_nvcsw - before.ru_nvcsw
+        usage['involuntary_ctxsw'] = after.ru_nivcsw - before.ru_nivcsw
+
+def collector_metadata(sysstat_usage, parser_usage):
+    """Combine the sysstat child and parser measurements into the 'collector' metadata block."""
+    return {
+        'duration_s': sysstat_usage['wall_s'],
+        'sysstat_user_s': sysstat_usage['user_s'],
+        'sysstat_system_s': sysstat_usage['system_s'],
+        'sysstat_voluntary_ctxsw': sysstat_usage['voluntary_ctxsw'],
+        'sysstat_involuntary_ctxsw': sysstat_usage['involuntary_ctxsw'],
+        'parser_user_s': parser_usage['user_s'],
+        'parser_system_s': parser_usage['system_s'],
+        'parser_voluntary_ctxsw': parser_usage['voluntary_ctxsw'],
+        'parser_involuntary_ctxsw': parser_usage['involuntary_ctxsw'],
+    }
+
+def collector_overhead_pct(metadata):
+    """Collector CPU use as percentages, or None when the run has no overhead record.
+
+    'usr' and 'sys' spread the sysstat child's time evenly over the online CPUs,
+    matching what the 'all' row of mpstat would show. 'single_cpu' is the upper
+    bound when all of it landed on one CPU. The parser runs after sampling ends,
+    so only the sysstat child is counted against the samples.
+    """
+    collector = metadata.get('collector')
+    if not collector or not collector.get('duration_s'):
+        return None
+
+    duration = collector['duration_s']
+    cpus = metadata.get('online_cpus') or 1
+    usr = collector['sysstat_user_s'] / duration * 100
+    sys_ = collector['sysstat_system_s'] / duration * 100
+    return {
+        'usr': usr / cpus,
+        'sys': sys_ / cpus,
+        'single_cpu': usr + sys_,
+    }
+
+def _read_sys(path, default=None):
+    try:
+        with open(path) as sys_file:
+            return sys_file.read().strip()
+    except OSError:
+        return default
+
+def read_cpu_topology(sys_cpu_dir="/sys/devices/system/cpu"):
+    """Socket, core, SMT siblings, last-level cache and NUMA node of every online CPU.
+
+    'smt' and 'llc' are the kernel's CPU list strings (e.g. '0,32' or '0-15,32-47'),
+    which name the sibling group and cache domain the CPU belongs to.
+    """
+    topology = []
+    if not os.path.isdir(sys_cpu_dir):
+        return topology
+
+    for entry in os.listdir(sys_cpu_dir):
+        match = re.fullmatch(r"cpu(\d+)", entry)
+        cpu_dir = os.path.join(sys_cpu_dir, entry)
+        topo_dir = os.path.join(cpu_dir, "topology")
+        if not match or not os.path.isdir(topo_dir):
+            continue  # Not a CPU, or an offline one
+
+        node = next((int(name[4:]) for name in os.listdir(cpu_dir) if re.fullmatch(r"node\d+", name)), 0)
+        smt = _read_sys(os.path.join(topo_dir, "thread_siblings_list"), match.group(1))
+
+        # The last-level cache is the cache index with the highest level
+        llc, llc_level = None, -1
+        cache_dir = os.path.join(cpu_dir, "cache")
+        if os.path.isdir(cache_dir):
+            for index in os.listdir(cache_dir):
+                if not index.startswith("index"):
+                    continue
+                level = int(_read_sys(os.path.join(cache_dir, index, "level"), "-1"))
+                if level > llc_level:
+                    llc_level = level
+                    llc = _read_sys(os.path.join(cache_dir, index, "shared_cpu_list"))
+
+        topology.append({
+            'cpu': int(match.group(1)),
+            'socket': int(_read_sys(os.path.join(topo_dir, "physical_package_id"), "0")),
+            'core': int(_read_sys(os.path.join(topo_dir, "core_id"), match.group(1))),
+            'smt': smt,
+            'llc': llc or smt,
+            'node': node,
+        })
+
+    return sorted(topology, key=lambda t: t['cpu'])
+
+def read_cgroup(pid, proc_root="/proc"):
+    """cgroup of a PID from /proc/<pid>/cgroup, with the container and pod IDs found in its path.
+
+    Uses the v1 hierarchy holding the cpu controller when there is one (hybrid
+    setups), otherwise the v2 unified hierarchy. Returns {} if the PID is gone.
+    """
+    entries = {}
+    try:
+        with open(os.path.join(proc_root, str(pid), "cgroup")) as cgroup_file:
+            for line in cgroup_file:
+                hierarchy, controllers, path = line.rstrip("\n").split(":", 2)
+                entries[controllers] = (hierarchy, path)
+    except (OSError, ValueError):
+        return {}
+
+    v1 = next((c for c in entries if "cpu" in c.split(",")), None)
+    if v1 is not None:
+        version, controllers, path = 1, v1, entries[v1][1]
+    elif "" in entries:
+        version, controllers, path = 2, "", entries[""][1]
+    else:
+        return {}
+
+    # Runtimes name the container by its 64-hex ID (docker-<id>.scope, cri-containerd-<id>.scope, /docker/<id>)
+    containers = re.findall(r"[0-9a-f]{64}", path)
+    pod = re.search(r"pod([0-9a-f]{8}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{4}[-_][0-9a-f]{12})", path)
+    return {
+        'path': path,
+        'version': version,
+        'controllers': controllers,
+        'container': containers[-1] if containers else None,
+        'pod': pod.group(1).replace("_", "-") if pod else None,
+    }
+
+def _cgroup_dir(cgroup, cgroup_root):
+    base = cgroup_root if cgroup['version'] == 2 else os.path.join(cgroup_root, cgroup['controllers'])
+    return os.path.join(base, cgroup['path'].lstrip("/"))
+
+def read_cgroup_cpu_stat(cgroup, cgroup_root="/sys/fs/cgroup"):
+    """Throttling counters of a cgroup from cpu.stat, in periods and seconds; {} if unreadable.
+
+    v1 reports throttled_time in nanoseconds, v2 throttled_usec (and usage_usec) in microseconds.
+    """
+    if not cgroup:
+        return {}
+    text = _read_sys(os.path.join(_cgroup_dir(cgroup, cgroup_root), "cpu.stat"))
+    if text is None:
+        return {}
+    raw = dict((key, int(value)) for key, value in (line.split() for line in text.splitlines() if line.strip()))
+    stat = {'nr_periods': raw.get('nr_periods', 0), 'nr_throttled': raw.get('nr_throttled', 0)}
+    if 'throttled_usec' in raw:
+        stat['throttled_s'] = raw['throttled_usec'] / 1e6
+    elif 'throttled_time' in raw:
+        stat['throttled_s'] = raw['throttled_time'] / 1e9
+    if 'usage_usec' in raw:
+        stat['usage_s'] = raw['usage_usec'] / 1e6
+    return stat
+
+def read_cgroup_cpu_limit(cgroup, cgroup_root="/sys/fs/cgroup"):
+    """CPU quota of a cgroup in CPUs (quota / period), or None when unlimited or unreadable."""
+    cgroup_dir = _cgroup_dir(cgroup, cgroup_root)
+    if cgroup['version'] == 2:
+        quota, _, period = (_read_sys(os.path.join(cgroup_dir, "cpu.max")) or "max").partition(" ")
+    else:
+        quota = _read_sys(os.path.join(cgroup_dir, "cpu.cfs_quota_us"), "-1")
+        period = _read_sys(os.path.join(cgroup_dir, "cpu.cfs_period_us"), "")
+    if quota in ("max", "-1") or not period:
+        return None
+    return int(quota) / int(period)
+
+def cgroup_metadata(cgroup, cpu_stat_before=None, cgroup_root="/sys/fs/cgroup"):
+    """The 'cgroup' entry of the run metadata; with cpu_stat_before, the cpu.stat deltas since then."""
+    if not cgroup:
+        return None
+    metadata = dict(cgroup, limit_cpus=read_cgroup_cpu_limit(cgroup, cgroup_root))
+    if cpu_stat_before:
+        after = read_cgroup_cpu_stat(cgroup, cgroup_root)
+        metadata['cpu_stat'] = {key: round(after[key] - cpu_stat_before[key], 6)
+                                for key in cpu_stat_before if key in after}
+    return metadata
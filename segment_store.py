@@ -0,0 +1,201 @@
+import csv
+import json
+import os
+import signal
+import subprocess
+import time
+from datetime import datetime
+from run_metadata import metadata_path, write_run_metadata, measure_children, measure_self, collector_metadata
+
+MANIFEST = "manifest.json"
+# Seconds a collector gets to print its last rows after being asked to stop
+STOP_GRACE_SECONDS = 5
+
+# Set by Ctrl+C or SIGTERM while run_daemon() runs; the collector of the current segment is stopped
+_stop = {'requested': False}
+
+def _atomic_write(path, write):
+    """Write through a temporary file in the same directory, then rename over the target."""
+    tmp_path = os.path.join(os.path.dirname(path), f".{os.path.basename(path)}.tmp")
+    with open(tmp_path, 'w', newline='') as tmp_file:
+        write(tmp_file)
+        tmp_file.flush()
+        os.fsync(tmp_file.fileno())
+    os.replace(tmp_path, path)
+
+def load_manifest(directory):
+    path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(path):
+        return {'segments': []}
+    with open(path) as manifest_file:
+        return json.load(manifest_file)
+
+def save_manifest(directory, manifest):
+    _atomic_write(os.path.join(directory, MANIFEST), lambda f: json.dump(manifest, f, indent=2))
+
+def _epoch_range(rows):
+    header = rows[0]
+    if 'Epoch' not in header:
+        return None, None
+    epoch_idx = header.index('Epoch')
+    epochs = [int(row[epoch_idx]) for row in rows[1:] if len(row) > epoch_idx and str(row[epoch_idx]).isdigit()]
+    return (min(epochs), max(epochs)) if epochs else (None, None)
+
+def write_segment(directory, tool, rows, metadata=None):
+    """Atomically write one segment CSV and record it in the manifest."""
+    start, end = _epoch_range(rows)
+    stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(start or time.time()))
+    file_name = f"{tool}_{stamp}.csv"
+    path = os.path.join(directory, file_name)
+
+    _atomic_write(path, lambda f: csv.writer(f).writerows(rows))
+    if metadata:
+        write_run_metadata(path, metadata)
+
+    manifest = load_manifest(directory)
+    manifest['segments'] = [s for s in manifest['segments'] if s['file'] != file_name]
+    manifest['segments'].append({
+        'file': file_name,
+        'tool': tool,
+        'start_epoch': start,
+        'end_epoch': end,
+        'bytes': _segment_bytes(directory, file_name),
+    })
+    save_manifest(directory, manifest)
+    return path
+
+def _segment_bytes(directory, file_name):
+    """Bytes a segment takes on disk: its CSV and its .meta.json sidecar."""
+    path = os.path.join(directory, file_name)
+    return sum(os.path.getsize(p) for p in (path, metadata_path(path)) if os.path.exists(p))
+
+def apply_retention(directory, max_age_seconds=None, max_bytes=None):
+    """Delete segments older than max_age_seconds, then the oldest ones until the total fits in max_bytes.
+
+    The total counts each segment's CSV and sidecar, plus the manifest itself.
+    """
+    manifest = load_manifest(directory)
+    segments = sorted(manifest['segments'], key=lambda s: s['end_epoch'] or 0)
+    evicted = []
+
+    if max_age_seconds:
+        cutoff = time.time() - max_age_seconds
+        evicted += [s for s in segments if (s['end_epoch'] or 0) < cutoff]
+        segments = [s for s in segments if s not in evicted]
+
+    if max_bytes:
+        manifest_path = os.path.join(directory, MANIFEST)
+        sizes = {s['file']: _segment_bytes(directory, s['file']) for s in segments}
+        total = sum(sizes.values()) + (os.path.getsize(manifest_path) if os.path.exists(manifest_path) else 0)
+        while segments and total > max_bytes:
+            oldest = segments.pop(0)
+            total -= sizes[oldest['file']]
+            evicted.append(oldest)
+
+    for segment in evicted:
+        path = os.path.join(directory, segment['file'])
+        for stale in (path, metadata_path(path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+        print(f"Retention: removed {segment['file']}")
+
+    if evicted:
+        manifest['segments'] = segments
+        save_manifest(directory, manifest)
+    return evicted
+
+def segments_for_range(directory, start=None, end=None, tool=None):
+    """Paths of the segments that overlap [start, end] (epoch seconds; None means open-ended)."""
+    paths = []
+    for segment in sorted(load_manifest(directory)['segments'], key=lambda s: s['start_epoch'] or 0):
+        if tool and segment['tool'] != tool:
+            continue
+        if start is not None and segment['end_epoch'] is not None and segment['end_epoch'] < start:
+            continue
+        if end is not None and segment['start_epoch'] is not None and segment['start_epoch'] > end:
+            continue
+        paths.append(os.path.join(directory, segment['file']))
+    return paths
+
+def parse_time_bound(text):
+    """'2026-10-19 13:00' (or with seconds, or a bare epoch) -> epoch seconds; empty -> None."""
+    text = text.strip()
+    if not text:
+        return None
+    if text.isdigit():
+        return int(text)
+    for fmt in ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M', '%Y-%m-%d'):
+        try:
+            return int(datetime.strptime(text, fmt).timestamp())
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized time '{text}', expected YYYY-mm-dd HH:MM")
+
+def _request_stop(signum, frame):
+    _stop['requested'] = True
+
+def run_collector(command, env=None):
+    """Run the collector of one segment and return its stdout.
+
+    When the daemon is asked to stop, the collector gets SIGINT, on which sysstat
+    prints its Average rows and exits, so the rows of the partial segment are kept.
+    """
+    child = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, env=env)
+    deadline = None
+    while True:
+        try:
+            stdout, _ = child.communicate(timeout=1)
+            return stdout
+        except subprocess.TimeoutExpired:
+            if not _stop['requested']:
+                continue
+            if deadline is None:
+                child.send_signal(signal.SIGINT)
+                deadline = time.time() + STOP_GRACE_SECONDS
+            elif time.time() > deadline:
+                child.kill()
+
+def run_daemon(tool, capture_segment, directory, segment_seconds, max_age_seconds=None, max_bytes=None, metadata=None):
+    """Capture back-to-back segments until interrupted (Ctrl+C or SIGTERM).
+
+    capture_segment(seconds) runs the collector for that long through run_collector()
+    and returns the parsed rows, header first. Segments end on multiples of
+    segment_seconds of wall-clock time, so hourly segments cover whole hours.
+    On Ctrl+C or SIGTERM the current collector is stopped and what it captured
+    so far is written as the last segment.
+    """
+    os.makedirs(directory, exist_ok=True)
+    _stop['requested'] = False
+    previous_handlers = {signum: signal.signal(signum, _request_stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+    print(f"Writing {segment_seconds}s {tool} segments to '{directory}'. Press Ctrl+C to stop.")
+
+    try:
+        while not _stop['requested']:
+            seconds = segment_seconds - int(time.time()) % segment_seconds
+            with measure_children() as sysstat_usage:
+                with measure_self() as parser_usage:
+                    rows = capture_segment(seconds)
+            if len(rows) > 1:
+                segment_metadata = dict(metadata or {}, tool=tool,
+                                        collector=collector_metadata(sysstat_usage, parser_usage))
+                path = write_segment(directory, tool, rows, segment_metadata)
+                print(f"Segment written to {path}")
+            apply_retention(directory, max_age_seconds, max_bytes)
+    finally:
+        for signum, handler in previous_handlers.items():
+            signal.signal(signum, handler)
+    print("Daemon stopped.")
+
+def get_daemon_input():
+    """Prompt for segment length and retention; returns (segment_seconds, max_age_seconds, max_bytes) or None."""
+    try:
+        segment_seconds = int(input("Enter segment length in seconds [Default: 3600]: ") or 3600)
+        max_age_hours = float(input("Enter retention in hours (0 to keep forever) [Default: 168]: ") or 168)
+        max_megabytes = float(input("Enter disk budget in MB (0 for no limit) [Default: 1024]: ") or 1024)
+    except ValueError:
+        print("Segment length, retention and disk budget must be numeric values.")
+        return None
+    if segment_seconds <= 0:
+        print("Segment length must be positive.")
+        return None
+    return segment_seconds, int(max_age_hours * 3600) or None, int(max_megabytes * 1024 * 1024) or None
@@ -0,0 +1,92 @@
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Instrumentation is opt-in through the environment so the scripts keep their prompts:
+#   SYSSTAT_TRACE=trace.jsonl         append one JSON record per stage to this file
+#   SYSSTAT_PROFILE=parse,render      dump a cProfile file for these stages ('all' for every stage)
+#   SYSSTAT_PROFILE_DIR=profiles      where the .prof files go (default: current directory)
+TRACE_ENV = "SYSSTAT_TRACE"
+PROFILE_ENV = "SYSSTAT_PROFILE"
+PROFILE_DIR_ENV = "SYSSTAT_PROFILE_DIR"
+
+_profile_counter = 0
+
+def _should_profile(name):
+    stages = os.environ.get(PROFILE_ENV, "")
+    selected = {s.strip() for s in stages.split(",") if s.strip()}
+    return "all" in selected or name in selected
+
+def _cpu_seconds(usage):
+    return usage.ru_utime + usage.ru_stime
+
+def _write_trace(trace_path, record):
+    with open(trace_path, 'a') as trace_file:
+        trace_file.write(json.dumps(record) + "\n")
+
+@contextmanager
+def stage(name, **details):
+    """Record wall time, CPU time and peak RSS of the enclosed block as one trace record.
+
+    Extra keyword arguments (metric, page, file, ...) are stored in the record.
+    ru_maxrss is a process-wide high-water mark, so the record carries both the
+    peak at the end of the stage and how much the stage raised it.
+    Does nothing unless SYSSTAT_TRACE or SYSSTAT_PROFILE is set.
+    """
+    global _profile_counter
+
+    trace_path = os.environ.get(TRACE_ENV)
+    profile = _should_profile(name)
+    if not trace_path and not profile:
+        yield
+        return
+
+    self_before = resource.getrusage(resource.RUSAGE_SELF)
+    children_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    started_at = time.time()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+
+    profiler = None
+    if profile:
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+        self_after = resource.getrusage(resource.RUSAGE_SELF)
+        children_after = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+        record = {
+            'script': os.path.basename(sys.argv[0]),
+            'pid': os.getpid(),
+            'stage': name,
+            'started_at': started_at,
+            'wall_s': round(wall, 6),
+            'cpu_s': round(cpu, 6),
+            'children_cpu_s': round(_cpu_seconds(children_after) - _cpu_seconds(children_before), 6),
+            'peak_rss_kb': self_after.ru_maxrss,
+            'peak_rss_growth_kb': self_after.ru_maxrss - self_before.ru_maxrss,
+        }
+        record.update(details)
+
+        if profiler:
+            profile_dir = os.environ.get(PROFILE_DIR_ENV, ".")
+            os.makedirs(profile_dir, exist_ok=True)
+            _profile_counter += 1
+            profile_path = os.path.join(profile_dir, f"{name}_{os.getpid()}_{_profile_counter}.prof")
+            profiler.dump_stats(profile_path)
+            record['profile'] = profile_path
+
+        if trace_path:
+            _write_trace(trace_path, record)
@@ -0,0 +1,220 @@
+import numpy as np
+import pandas as pd
+import os
+from sysstat_query import load_mpstat, load_pidstat
+from stage_timing import stage
+
+# Level rules: a metric at or above 'threshold' for at least 'min_samples' consecutive samples.
+# 'busy' is 100 - %idle.
+MPSTAT_RULES = {
+    'saturation': {'metric': 'busy', 'threshold': 95, 'min_samples': 3},
+    'steal': {'metric': '%steal', 'threshold': 10, 'min_samples': 1},
+    'iowait': {'metric': '%iowait', 'threshold': 20, 'min_samples': 3},
+}
+PIDSTAT_RULES = {
+    'saturation': {'metric': '%CPU', 'threshold': 95, 'min_samples': 3},
+}
+# Spike rules: z-score against the previous 'window' samples of the same CPU or thread
+MPSTAT_SPIKE_METRICS = ['busy', '%steal', '%iowait']
+PIDSTAT_SPIKE_METRICS = ['%CPU']
+# Lower bound on the baseline std (percentage points), so flat series do not turn noise into huge z-scores
+STD_FLOOR = 1.0
+
+INCIDENT_COLUMNS = ['File', 'Kind', 'Metric', 'Key', 'Command', 'Start', 'End', 'Start_s', 'End_s',
+                    'Samples', 'Duration_s', 'Peak', 'Mean', 'Severity']
+
+class Series:
+    """Per-interval values of every CPU or thread, sorted by (group, Epoch) into flat arrays."""
+
+    def __init__(self, df, key_column):
+        # Copy only what detection reads; on a day of 1s samples every copy of the frame is gigabytes
+        df = df.drop(columns='Timestamp', errors='ignore')
+        if df['Epoch'].isnull().any():
+            df = df[df['Epoch'].notnull()]
+        file_codes, self.file_names = pd.factorize(df['File'])
+        key_codes, key_names = pd.factorize(df[key_column])
+        self.key_names = np.asarray(key_names.astype(str), dtype=object)
+        epochs = df['Epoch'].to_numpy(dtype='int64')
+        # Rows of a CSV are already in time order, so a stable sort on the group keeps each group chronological
+        order = np.argsort(file_codes.astype('int64') * len(key_names) + key_codes, kind='stable')
+
+        self.df = df.drop(columns='File').iloc[order].reset_index(drop=True)
+        self.file_codes = file_codes[order]
+        self.key_codes = key_codes[order]
+        self.epochs = epochs[order]
+        changed = (np.diff(self.file_codes) != 0) | (np.diff(self.key_codes) != 0)
+        self.group_start = np.r_[True, changed] if len(epochs) else np.zeros(0, dtype=bool)
+
+        # Seconds each sample stands for: its Interval, else the gap to the previous sample of the group
+        # (the next one for the first)
+        gaps = np.diff(self.epochs, prepend=self.epochs[:1])
+        next_gap = np.r_[gaps[1:], 1]
+        next_in_group = np.r_[~self.group_start[1:], False]
+        self.steps = np.clip(np.where(self.group_start, np.where(next_in_group, next_gap, 1), gaps), 1, None)
+        if 'Interval' in self.df.columns:
+            self.steps = np.where(self.df['Interval'].isnull(), self.steps, self.df['Interval'].fillna(0).to_numpy(dtype='int64'))
+
+        # Start of each file's run, for seconds since start (as used by mpstat_resample)
+        run_start = np.full(len(self.file_names), np.iinfo('int64').max)
+        np.minimum.at(run_start, self.file_codes, self.epochs)
+        self.elapsed = self.epochs - run_start[self.file_codes]
+
+    def values(self, metric):
+        return self.df[metric].to_numpy(dtype='float64')
+
+def rolling_baseline(values, group_start, window):
+    """Mean and std of the previous 'window' samples of the same group, from cumulative sums.
+
+    NaN until a group has 'window' samples of history.
+    """
+    n = len(values)
+    clean = np.where(np.isnan(values), 0.0, values)
+    sums = np.r_[0.0, np.cumsum(clean)]
+    squares = np.r_[0.0, np.cumsum(clean * clean)]
+    index = np.arange(n)
+    first = np.maximum.accumulate(np.where(group_start, index, 0)) if n else index
+    low = index - window
+    valid = low >= first
+    low = np.clip(low, 0, None)
+
+    mean = np.where(valid, (sums[:n] - sums[low]) / window, np.nan)
+    var = np.where(valid, (squares[:n] - squares[low]) / window - mean * mean, np.nan)
+    return mean, np.sqrt(np.clip(var, 0, None))
+
+def find_runs(flags, group_start, min_samples):
+    """(start, length) index arrays of runs of consecutive flagged samples within a group."""
+    continues = np.r_[False, flags[:-1]] & ~group_start
+    starts = np.flatnonzero(flags & ~continues)
+    if not len(starts):
+        return starts, starts
+    # Flagged samples are contiguous per run, so run lengths are the gaps between run starts in the flagged positions
+    flagged_positions = np.cumsum(flags) - 1
+    offsets = flagged_positions[starts]
+    lengths = np.diff(np.r_[offsets, flags.sum()])
+    keep = lengths >= min_samples
+    return starts[keep], lengths[keep]
+
+def summarize_runs(series, kind, metric, values, excess, starts, lengths, commands=None):
+    """One incident row per run: time span, peak, mean and severity (excess integrated over time)."""
+    if not len(starts):
+        return pd.DataFrame(columns=INCIDENT_COLUMNS)
+
+    # Gather the run samples into one flat array so reduceat works on contiguous slices
+    run_index = np.repeat(starts - np.r_[0, np.cumsum(lengths)[:-1]], lengths) + np.arange(lengths.sum())
+    offsets = np.r_[0, np.cumsum(lengths)[:-1]]
+    run_values = values[run_index]
+    ends = starts + lengths - 1
+
+    return pd.DataFrame({
+        'File': np.asarray(series.file_names, dtype=object)[series.file_codes[starts]],
+        'Kind': kind,
+        'Metric': metric,
+        'Key': series.key_names[series.key_codes[starts]],
+        'Command': commands[starts] if commands is not None else '',
+        'Start': series.epochs[starts],
+        'End': series.epochs[ends],
+        'Start_s': series.elapsed[starts],
+        'End_s': series.elapsed[ends],
+        'Samples': lengths,
+        'Duration_s': np.add.reduceat(series.steps[run_index], offsets),
+        'Peak': np.maximum.reduceat(run_values, offsets),
+        'Mean': np.add.reduceat(run_values, offsets) / lengths,
+        'Severity': np.add.reduceat(excess[run_index] * series.steps[run_index], offsets),
+    })
+
+def detect(series, rules, spike_metrics, window=60, z_threshold=4.0, commands=None):
+    """Apply level and spike rules to every CPU or thread; returns incidents ranked by severity."""
+    incidents = []
+    for kind, rule in rules.items():
+        if rule['metric'] not in series.df.columns:
+            continue
+        values = series.values(rule['metric'])
+        flags = values >= rule['threshold']  # NaN compares False
+        starts, lengths = find_runs(flags, series.group_start, rule['min_samples'])
+        incidents.append(summarize_runs(series, kind, rule['metric'], values, values - rule['threshold'],
+                                        starts, lengths, commands))
+
+    for metric in spike_metrics:
+        if metric not in series.df.columns:
+            continue
+        values = series.values(metric)
+        mean, std = rolling_baseline(values, series.group_start, window)
+        z = (values - mean) / np.maximum(std, STD_FLOOR)
+        flags = z >= z_threshold
+        starts, lengths = find_runs(flags, series.group_start, 1)
+        incidents.append(summarize_runs(series, 'spike', metric, values, values - mean,
+                                        starts, lengths, commands))
+
+    incidents = [frame for frame in incidents if not frame.empty]
+    if not incidents:
+        return pd.DataFrame(columns=INCIDENT_COLUMNS)
+    result = pd.concat(incidents, ignore_index=True)
+    return result.sort_values('Severity', ascending=False, kind='stable').reset_index(drop=True)
+
+def detect_mpstat(paths, window=60, z_threshold=4.0):
+    metrics = sorted({rule['metric'] for rule in MPSTAT_RULES.values()} | set(MPSTAT_SPIKE_METRICS))
+    source_metrics = [m for m in metrics if m != 'busy'] + ['%idle']
+    with stage('load', tool='mpstat'):
+        df = load_mpstat(paths, metrics=source_metrics, summary_only=False)
+    if df.empty:
+        return pd.DataFrame(columns=INCIDENT_COLUMNS)
+    df['busy'] = 100 - df['%idle']
+    with stage('detect', tool='mpstat', rows=len(df)):
+        return detect(Series(df, 'CPU'), MPSTAT_RULES, MPSTAT_SPIKE_METRICS, window, z_threshold)
+
+def detect_pidstat(paths, window=60, z_threshold=4.0):
+    with stage('load', tool='pidstat'):
+        df = load_pidstat(paths, metrics=['%CPU'], summary_only=False)
+    if df.empty:
+        return pd.DataFrame(columns=INCIDENT_COLUMNS)
+    # With -t, pidstat prints a process row (TGID set) next to its threads; keep one series per thread
+    threads = df[df['TGID'].isnull()]
+    if not threads.empty:
+        df = threads
+    with stage('detect', tool='pidstat', rows=len(df)):
+        series = Series(df, 'TID')
+        commands = series.df['Command'].str.replace('|__', '', n=1, regex=False).to_numpy(dtype=object)
+        return detect(series, PIDSTAT_RULES, PIDSTAT_SPIKE_METRICS, window, z_threshold, commands)
+
+def load_incidents(path):
+    """Incidents written by this script, or an empty frame when there are none."""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=INCIDENT_COLUMNS)
+    return pd.read_csv(path, dtype={'Key': str, 'Command': str})
+
+def main():
+    tool = input("Data to scan (mpstat/pidstat) [Default: mpstat]: ").strip().lower() or "mpstat"
+    if tool not in ("mpstat", "pidstat"):
+        print(f"Unknown tool '{tool}'.")
+        return
+    default_dir = "mpstat_data" if tool == "mpstat" else "pidstat_data"
+    paths = input(f"Enter CSV files or directories (comma separated) [Default: {default_dir}]: ").strip() or default_dir
+
+    try:
+        window = int(input("Enter the baseline window in samples [Default: 60]: ").strip() or 60)
+        z_threshold = float(input("Enter the z-score that counts as a spike [Default: 4]: ").strip() or 4)
+        limit = int(input("Enter the number of incidents to keep [Default: 50]: ").strip() or 50)
+    except ValueError:
+        print("Window, z-score and incident count must be numeric values.")
+        return
+
+    if tool == "mpstat":
+        incidents = detect_mpstat(paths, window, z_threshold)
+        output_dir = "mpstat_plots"
+    else:
+        incidents = detect_pidstat(paths, window, z_threshold)
+        output_dir = "pidstat_command_plots"
+
+    if incidents.empty:
+        print("No incidents found.")
+        return
+
+    incidents = incidents.head(limit)
+    print(incidents[['File', 'Kind', 'Metric', 'Key', 'Command', 'Start_s', 'Duration_s', 'Peak', 'Severity']].to_string(index=False))
+    os.makedirs(output_dir, exist_ok=True)
+    incidents_csv = os.path.join(output_dir, "incidents.csv")
+    incidents.to_csv(incidents_csv, index=False)
+    print(f"Incidents saved to {incidents_csv}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,172 @@
+import matplotlib.pyplot as plt
+import seaborn as sns
+import numpy as np
+import pandas as pd
+import os
+import re
+from sysstat_query import load_mpstat, load_pidstat, resolve_paths
+from stage_timing import stage
+
+# Function to fill missing intervals with the shortest gap between the samples of each file
+def fill_intervals(df):
+    gaps = df.groupby('File')['Epoch'].transform(lambda epochs: np.diff(np.unique(epochs)).min() if epochs.nunique() > 1 else 1)
+    return df['Interval'].astype('float64').fillna(gaps)
+
+# Function to load the per-interval busy time of every core
+def load_core_busy(mpstat_paths):
+    df = load_mpstat(mpstat_paths, metrics=['%idle'], summary_only=False)
+    if df.empty:
+        return df
+    df = df[(df['CPU'] != 'all') & df['Epoch'].notnull()].copy()
+    df['Core'] = df['CPU'].astype(int)
+    df['Epoch'] = df['Epoch'].astype('int64')
+    df['Interval'] = fill_intervals(df).astype('int64')
+    df['Busy %'] = 100 - df['%idle']
+    return df[['Core', 'Epoch', 'Interval', 'Busy %']]
+
+# Function to fill the CPU column from the /proc placement samples nearest in time, at most one interval away
+def fill_from_placement(df, placement_paths):
+    placement = pd.concat([pd.read_csv(path) for path in placement_paths], ignore_index=True)
+    placement = placement.rename(columns={'CPU': 'Placed'}).astype('int64').sort_values('Epoch')
+    tolerance = int(np.ceil(df['Interval'].max()))
+    df = pd.merge_asof(df.sort_values('Epoch'), placement, on='Epoch', by='TID', direction='nearest',
+                       tolerance=tolerance)
+    df['CPU'] = df['CPU'].fillna(df['Placed'])
+    return df.drop(columns='Placed')
+
+# Function to find the /proc placement samples written next to pid_<pid>_info.csv files
+def find_placement_files(files):
+    placement_paths = []
+    for file in files:
+        match = re.match(r"pid_(\d+)_", os.path.basename(file))
+        if match:
+            path = os.path.join(os.path.dirname(file), f"pid_{match.group(1)}_placement.csv")
+            if os.path.exists(path) and path not in placement_paths:
+                placement_paths.append(path)
+    return placement_paths
+
+# Function to load the per-interval thread rows with the core each thread last ran on
+def load_thread_cores(pidstat_paths):
+    # The _metrics.csv files repeat %CPU and CPU of the same threads
+    files = resolve_paths(pidstat_paths, exclude=('_metrics', '_placement'))
+    placement_paths = find_placement_files(files)
+    df = load_pidstat(files, metrics=['%CPU', 'CPU'], summary_only=False)
+    if df.empty:
+        return df
+    # With -t, pidstat prints a process row (TGID set) next to its threads; attribute the threads
+    threads = df[df['TGID'].isnull()]
+    if not threads.empty:
+        df = threads
+    df = df[df['Epoch'].notnull()].copy()
+    df['Epoch'] = df['Epoch'].astype('int64')
+    df['TID'] = pd.to_numeric(df['TID'], errors='coerce')
+    df = df[df['TID'].notnull()].astype({'TID': 'int64'})
+    # Seconds each row stands for, to weight its %CPU
+    df['Interval'] = fill_intervals(df)
+
+    if 'CPU' not in df.columns:
+        df['CPU'] = np.nan
+    if df['CPU'].isnull().any() and placement_paths:
+        df = fill_from_placement(df, placement_paths)
+    df = df[df['CPU'].notnull()].copy()
+    df['Core'] = df['CPU'].astype('int64')
+    df['Thread'] = df['Command'].str.replace('|__', '', n=1, regex=False) + ' (' + df['TID'].astype(str) + ')'
+    return df[['Epoch', 'Interval', 'Thread', 'Core', '%CPU']]
+
+# Function to keep only the mpstat intervals the pidstat capture covers
+def cores_in_window(cores, threads):
+    return cores[(cores['Epoch'] >= threads['Epoch'].min())
+                 & (cores['Epoch'] - cores['Interval'] < threads['Epoch'].max())]
+
+# Function to split each core's busy time per interval between the threads that last ran on it
+def attribute(cores, threads):
+    """Rows of (Core, Core Epoch, Thread, Seconds) plus each core's total busy seconds.
+
+    Each pidstat row is charged to the mpstat sample of its core that it ends in,
+    for its own interval: with pidstat sampling every 1s and mpstat every 5s, five
+    thread rows share one core sample. Shares are scaled down when the threads on a
+    core claim more seconds than the core was busy; busy time left over is 'other'.
+    """
+    interval = int(cores['Interval'].max())
+    cores = cores.sort_values('Epoch').rename(columns={'Epoch': 'Core Epoch', 'Interval': 'Core Interval'})
+
+    joined = pd.merge_asof(threads.sort_values('Epoch'), cores, left_on='Epoch', right_on='Core Epoch',
+                           by='Core', direction='forward', tolerance=interval)
+    joined = joined[joined['Busy %'].notnull()]
+
+    joined['Seconds'] = joined['%CPU'] / 100 * joined['Interval']
+    claimed = joined.groupby(['Core', 'Core Epoch'])['Seconds'].transform('sum')
+    busy = joined['Busy %'] / 100 * joined['Core Interval']
+    joined['Seconds'] *= np.minimum(1.0, busy / claimed.where(claimed > 0)).fillna(0)
+
+    busy_seconds = (cores['Busy %'] / 100 * cores['Core Interval']).groupby(cores['Core']).sum()
+    return joined[['Core', 'Core Epoch', 'Thread', 'Seconds']], busy_seconds
+
+# Function to build the core x thread matrix of busy seconds, with the unattributed remainder as 'other'
+def contribution_matrix(contributions, busy_seconds):
+    matrix = contributions.pivot_table(index='Core', columns='Thread', values='Seconds', aggfunc='sum', fill_value=0)
+    matrix = matrix.reindex(busy_seconds.index, fill_value=0)
+    matrix['other'] = (busy_seconds - matrix.sum(axis=1)).clip(lower=0)
+    # Busiest threads first
+    return matrix[matrix.sum().sort_values(ascending=False).index]
+
+# Function to print the busiest cores with the threads behind them
+def print_report(matrix, cores, busy_seconds, threshold, top_cores=10, top_threads=3):
+    saturated = cores[cores['Busy %'] >= threshold].groupby('Core').size()
+    for core in busy_seconds.sort_values(ascending=False).index[:top_cores]:
+        total = busy_seconds[core]
+        print(f"CPU {core}: {total:.1f} busy seconds, {saturated.get(core, 0)} intervals at or above {threshold:g}%")
+        shares = matrix.loc[core].sort_values(ascending=False)
+        for thread, seconds in shares[shares > 0].head(top_threads).items():
+            print(f"    {thread}: {seconds:.1f} s ({100 * seconds / total:.0f}%)")
+
+# Function to plot the matrix as a heatmap of the busiest threads
+def plot_heatmap(matrix, pdf_path, top_threads=20):
+    columns = [c for c in matrix.columns if c != 'other'][:top_threads] + ['other']
+    data = matrix[columns]
+    fig, ax = plt.subplots(figsize=(11, max(4, 0.3 * len(data) + 2)))
+    sns.heatmap(data, cmap='rocket_r', ax=ax, cbar_kws={'label': 'Busy seconds'})
+    ax.set_title('Core busy time by thread')
+    ax.set_xlabel('Thread')
+    ax.set_ylabel('CPU')
+    plt.tight_layout()
+    fig.savefig(pdf_path)
+    plt.close(fig)
+
+def main():
+    mpstat_paths = input("Enter mpstat CSV files or directories (comma separated) [Default: mpstat_data]: ").strip() or "mpstat_data"
+    pidstat_paths = input("Enter pidstat CSV files or directories (comma separated) [Default: pidstat_data]: ").strip() or "pidstat_data"
+    try:
+        threshold = float(input("Enter the busy % that counts as saturated [Default: 95]: ").strip() or 95)
+    except ValueError:
+        print("The saturation threshold must be a numeric value.")
+        return
+
+    with stage('load', tool='mpstat'):
+        cores = load_core_busy(mpstat_paths)
+    with stage('load', tool='pidstat'):
+        threads = load_thread_cores(pidstat_paths)
+    if cores.empty or threads.empty:
+        print("Per-core mpstat rows and per-thread pidstat rows with a CPU column are both needed.")
+        return
+
+    cores = cores_in_window(cores, threads)
+    if cores.empty:
+        print("The mpstat and pidstat captures do not overlap in time.")
+        return
+    with stage('attribute', rows=len(threads)):
+        contributions, busy_seconds = attribute(cores, threads)
+        matrix = contribution_matrix(contributions, busy_seconds)
+
+    print_report(matrix, cores, busy_seconds, threshold)
+    output_dir = "mpstat_plots"
+    os.makedirs(output_dir, exist_ok=True)
+    matrix_csv = os.path.join(output_dir, "core_thread_matrix.csv")
+    matrix.round(3).to_csv(matrix_csv)
+    print(f"Core x thread matrix saved to {matrix_csv}")
+    pdf_path = os.path.join(output_dir, "core_attribution.pdf")
+    plot_heatmap(matrix, pdf_path)
+    print(f"Heatmap saved to {pdf_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Decide whether a candidate run set uses more CPU than a baseline run set.
+
+Meant for CI: compares the interval samples of every CPU (mpstat) or command
+(pidstat) per metric, writes a JSON verdict and exits with status 1 when a
+regression beyond the tolerance is found.
+
+    python3 sysstat_compare.py --tool mpstat --baseline base/ --candidate cand/ --tolerance 2
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import numpy as np
+import pandas as pd
+from sysstat_query import load_mpstat, load_pidstat
+from stage_timing import stage
+
+# Metrics where a higher value means more CPU used; 'busy' is 100 - %idle
+MPSTAT_COMPARE_METRICS = ['busy', '%usr', '%sys', '%iowait', '%steal']
+PIDSTAT_COMPARE_METRICS = ['%CPU']
+# Upper bound on bootstrap draws gathered at once, to keep memory flat for long runs
+BOOTSTRAP_CHUNK = 5_000_000
+
+def load_samples(tool, paths, metrics):
+    """Interval samples with a Key column: the CPU for mpstat, the command for pidstat."""
+    if tool == 'mpstat':
+        source = [m for m in metrics if m != 'busy'] + (['%idle'] if 'busy' in metrics else [])
+        df = load_mpstat(paths, metrics=source, summary_only=False)
+        if df.empty:
+            return pd.DataFrame(columns=['Key', 'Weight'] + metrics)
+        if 'busy' in metrics:
+            df['busy'] = 100 - df['%idle']
+        df['Key'] = df['CPU']
+    else:
+        df = load_pidstat(paths, metrics=metrics, summary_only=False)
+        if df.empty:
+            return pd.DataFrame(columns=['Key', 'Weight'] + metrics)
+        # With -t, pidstat prints a process row next to its threads; sum the threads of each command
+        threads = df[df['TGID'].isnull()]
+        if not threads.empty:
+            df = threads
+        df = df.assign(Key=df['Command'].str.replace('|__', '', n=1, regex=False))
+        df = df.groupby(['File', 'Epoch', 'Key'], dropna=False).agg(
+            {**{m: 'sum' for m in metrics}, 'Interval': 'first'}).reset_index()
+    df['Weight'] = df['Interval'].astype('float64').fillna(1.0)
+    return df[['Key', 'Weight'] + metrics]
+
+def bootstrap_means(values, weights, draws, rng):
+    """Interval-weighted means of 'draws' resamples (with replacement), one column per metric.
+
+    values and weights are (samples, metrics); a NaN value should carry a zero weight.
+    Each resample is drawn once as a vector of per-sample counts and shared by all metrics.
+    """
+    n = len(values)
+    weighted = np.where(weights > 0, values * weights, 0.0)
+    chunk = max(1, BOOTSTRAP_CHUNK // n)
+    means = []
+    for start in range(0, draws, chunk):
+        size = min(chunk, draws - start)
+        index = rng.integers(0, n, size=(size, n)) + (np.arange(size) * n)[:, None]
+        counts = np.bincount(index.ravel(), minlength=size * n).reshape(size, n).astype('float64')
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means.append((counts @ weighted) / (counts @ weights))
+    return np.concatenate(means)
+
+def mann_whitney_greater(baseline, candidate):
+    """One-sided p-value that candidate samples tend to be larger (normal approximation, tie corrected)."""
+    n1, n2 = len(baseline), len(candidate)
+    ranks = pd.Series(np.concatenate([baseline, candidate])).rank(method='average').to_numpy()
+    u = ranks[n1:].sum() - n2 * (n2 + 1) / 2
+    _, tie_counts = np.unique(np.concatenate([baseline, candidate]), return_counts=True)
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - (tie_counts ** 3 - tie_counts).sum() / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (u - n1 * n2 / 2 - 0.5) / math.sqrt(variance)
+    return 0.5 * math.erfc(z / math.sqrt(2))
+
+def compare_new_key(key, cand, metrics, tolerances, draws, low_q, high_q, rng):
+    """Rows for a key only the candidate has (a new command, thread or CPU), against a baseline of 0.
+
+    The delta is the candidate mean itself; with no baseline samples there is no
+    Mann-Whitney test, so a regression needs only the lower confidence bound above the tolerance.
+    """
+    present = [m for m in metrics if m in cand.columns]
+    c = cand[present].to_numpy(dtype='float64')
+    cw = np.where(np.isnan(c), 0.0, cand['Weight'].to_numpy()[:, None])
+    ci_low, ci_high = np.nanquantile(bootstrap_means(c, cw, draws, rng), [low_q, high_q], axis=0)
+    rows = []
+
+    for i, metric in enumerate(present):
+        c_ok = cw[:, i] > 0
+        if c_ok.sum() < 2:
+            continue
+        cand_mean = (c[c_ok, i] * cw[c_ok, i]).sum() / cw[c_ok, i].sum()
+        tolerance = tolerances.get(metric, tolerances['default'])
+        rows.append({
+            'key': str(key), 'metric': metric, 'new_key': True,
+            'baseline_mean': 0.0, 'candidate_mean': round(cand_mean, 3), 'delta': round(cand_mean, 3),
+            'ci_low': round(float(ci_low[i]), 3), 'ci_high': round(float(ci_high[i]), 3),
+            'p_value': None, 'tolerance': tolerance,
+            'baseline_samples': 0, 'candidate_samples': int(c_ok.sum()),
+            'regression': bool(ci_low[i] > tolerance),
+        })
+    return rows
+
+def compare(baseline, candidate, metrics, tolerances, draws=1000, confidence=0.95, alpha=0.05, seed=0, new_keys='zero'):
+    """One row per (key, metric): means, delta with its bootstrap confidence interval, p-value and verdict.
+
+    A regression needs the lower confidence bound of the delta above the tolerance
+    and the Mann-Whitney test to agree (p < alpha). Keys only the candidate has are
+    compared against a baseline of 0 (new_keys='zero') or left out (new_keys='ignore').
+    """
+    rng = np.random.default_rng(seed)
+    low_q, high_q = (1 - confidence) / 2, (1 + confidence) / 2
+    base_groups = dict(tuple(baseline.groupby('Key', sort=False)))
+    rows = []
+
+    for key, cand in candidate.groupby('Key', sort=False):
+        base = base_groups.get(key)
+        if base is None:
+            if new_keys == 'zero':
+                rows += compare_new_key(key, cand, metrics, tolerances, draws, low_q, high_q, rng)
+            continue
+        present = [m for m in metrics if m in base.columns and m in cand.columns]
+        b, c = base[present].to_numpy(dtype='float64'), cand[present].to_numpy(dtype='float64')
+        # Missing values drop out of a metric by getting no weight
+        bw = np.where(np.isnan(b), 0.0, base['Weight'].to_numpy()[:, None])
+        cw = np.where(np.isnan(c), 0.0, cand['Weight'].to_numpy()[:, None])
+        deltas = bootstrap_means(c, cw, draws, rng) - bootstrap_means(b, bw, draws, rng)
+        ci_low, ci_high = np.nanquantile(deltas, [low_q, high_q], axis=0)
+
+        for i, metric in enumerate(present):
+            b_ok, c_ok = bw[:, i] > 0, cw[:, i] > 0
+            if b_ok.sum() < 2 or c_ok.sum() < 2:
+                continue
+            base_mean = (b[b_ok, i] * bw[b_ok, i]).sum() / bw[b_ok, i].sum()
+            cand_mean = (c[c_ok, i] * cw[c_ok, i]).sum() / cw[c_ok, i].sum()
+            p_value = mann_whitney_greater(b[b_ok, i], c[c_ok, i])
+            tolerance = tolerances.get(metric, tolerances['default'])
+
+            rows.append({
+                'key': str(key), 'metric': metric, 'new_key': False,
+                'baseline_mean': round(base_mean, 3), 'candidate_mean': round(cand_mean, 3),
+                'delta': round(cand_mean - base_mean, 3),
+                'ci_low': round(float(ci_low[i]), 3), 'ci_high': round(float(ci_high[i]), 3),
+                'p_value': float(f'{p_value:.3g}'), 'tolerance': tolerance,
+                'baseline_samples': int(b_ok.sum()), 'candidate_samples': int(c_ok.sum()),
+                'regression': bool(ci_low[i] > tolerance and p_value < alpha),
+            })
+
+    return sorted(rows, key=lambda row: (not row['regression'], -row['delta']))
+
+def parse_tolerances(default, overrides):
+    """{'default': pp, metric: pp} from --tolerance and repeated --metric-tolerance METRIC=PP."""
+    tolerances = {'default': default}
+    for override in overrides:
+        metric, _, value = override.partition('=')
+        tolerances[metric.strip()] = float(value)
+    return tolerances
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare a candidate run set against a baseline and fail on CPU regressions.")
+    parser.add_argument('--tool', choices=['mpstat', 'pidstat'], default='mpstat')
+    parser.add_argument('--baseline', required=True, help="CSV files or directories (comma separated)")
+    parser.add_argument('--candidate', required=True, help="CSV files or directories (comma separated)")
+    parser.add_argument('--metrics', help="Comma separated metrics (default: busy,%%usr,%%sys,%%iowait,%%steal or %%CPU)")
+    parser.add_argument('--tolerance', type=float, default=2.0, help="Allowed increase in percentage points (default: 2)")
+    parser.add_argument('--metric-tolerance', action='append', default=[], metavar='METRIC=PP',
+                        help="Per-metric tolerance, e.g. %%sys=1 (repeatable)")
+    parser.add_argument('--confidence', type=float, default=0.95, help="Confidence level of the delta interval (default: 0.95)")
+    parser.add_argument('--alpha', type=float, default=0.05, help="Significance level of the Mann-Whitney test (default: 0.05)")
+    parser.add_argument('--bootstrap', type=int, default=1000, help="Bootstrap resamples (default: 1000)")
+    parser.add_argument('--new-keys', choices=['zero', 'ignore'], default='zero',
+                        help="Keys only in the candidate: compare against a baseline of 0 (default) or leave out")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="Verdict JSON path (default: mpstat_plots/verdict.json or pidstat_command_plots/verdict.json)")
+    args = parser.parse_args(argv)
+
+    if args.metrics:
+        metrics = [m.strip() for m in args.metrics.split(',')]
+    else:
+        metrics = MPSTAT_COMPARE_METRICS if args.tool == 'mpstat' else PIDSTAT_COMPARE_METRICS
+    try:
+        tolerances = parse_tolerances(args.tolerance, args.metric_tolerance)
+    except ValueError:
+        parser.error("--metric-tolerance takes METRIC=PP with a numeric PP")
+
+    with stage('load', tool=args.tool):
+        baseline = load_samples(args.tool, args.baseline, metrics)
+        candidate = load_samples(args.tool, args.candidate, metrics)
+    if baseline.empty or candidate.empty:
+        print("No interval rows found in the baseline or candidate runs.")
+        return 2
+
+    with stage('compare', baseline_rows=len(baseline), candidate_rows=len(candidate)):
+        comparisons = compare(baseline, candidate, metrics, tolerances, args.bootstrap, args.confidence, args.alpha,
+                              args.seed, args.new_keys)
+    regressions = [row for row in comparisons if row['regression']]
+    new_keys = sorted(set(candidate['Key'].astype(str)) - set(baseline['Key'].astype(str)))
+
+    verdict = {
+        'verdict': 'regression' if regressions else 'pass',
+        'tool': args.tool,
+        'baseline': args.baseline,
+        'candidate': args.candidate,
+        'settings': {'metrics': metrics, 'tolerances': tolerances, 'confidence': args.confidence,
+                     'alpha': args.alpha, 'bootstrap': args.bootstrap, 'seed': args.seed, 'new_keys': args.new_keys},
+        'regressions': len(regressions),
+        'candidate_only_keys': new_keys,
+        'comparisons': comparisons,
+    }
+    output = args.output or os.path.join("mpstat_plots" if args.tool == 'mpstat' else "pidstat_command_plots", "verdict.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(verdict, file, indent=2)
+
+    if new_keys:
+        print(f"Only in the candidate ({args.new_keys}): {', '.join(new_keys)}")
+    for row in regressions:
+        if row['new_key']:
+            print(f"REGRESSION {row['key']} {row['metric']}: new at {row['candidate_mean']:.2f} "
+                  f"({args.confidence:.0%} CI {row['ci_low']:.2f}..{row['ci_high']:.2f})")
+            continue
+        print(f"REGRESSION {row['key']} {row['metric']}: {row['baseline_mean']:.2f} -> {row['candidate_mean']:.2f} "
+              f"(+{row['delta']:.2f}, {args.confidence:.0%} CI {row['ci_low']:.2f}..{row['ci_high']:.2f}, p={row['p_value']:.3g})")
+    print(f"{verdict['verdict'].upper()}: {len(regressions)} of {len(comparisons)} comparisons regressed. Verdict saved to {output}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,126 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+DEFAULT_PORT = 9105
+
+# Series every exporter serves next to the tool's own families
+EXPORTER_FAMILIES = {
+    'sysstat_exporter_samples_total': ('counter', "Samples captured since the exporter started."),
+    'sysstat_exporter_last_sample_timestamp_seconds': ('gauge', "Unix time of the latest sample."),
+}
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class MetricsBuffer:
+    """Latest gauge values and running counters, kept as a ready-to-send Prometheus text body.
+
+    Series are keyed by (family, ((label, value), ...)). The 'name{labels} ' prefix
+    of each series is formatted once and cached, and the body is rebuilt once per
+    sample, so a scrape only sends the current bytes object.
+    """
+
+    def __init__(self, families):
+        self.families = families
+        self.headers = {name: f"# HELP {name} {help_text}\n# TYPE {name} {kind}\n".encode()
+                        for name, (kind, help_text) in families.items()}
+        self.prefixes = {}
+        self.counters = {}
+        self.body = b""
+
+    def _prefix(self, key):
+        prefix = self.prefixes.get(key)
+        if prefix is None:
+            name, labels = key
+            label_text = ",".join(f'{label}="{_escape(value)}"' for label, value in labels)
+            prefix = self.prefixes[key] = (f"{name}{{{label_text}}} " if labels else f"{name} ").encode()
+        return prefix
+
+    def update(self, gauges, increments, keep_series=None):
+        """Replace the gauges and add the increments to the counters.
+
+        Counters missing from this sample are dropped, unless keep_series(keys) returns
+        them among the keys still alive (e.g. threads filtered out but not exited).
+        """
+        stale = [key for key in self.counters if key not in increments]
+        kept = keep_series(stale) if keep_series and stale else ()
+        counters = {key: self.counters[key] for key in kept}
+        for key, delta in increments.items():
+            counters[key] = self.counters.get(key, 0.0) + delta
+        self.counters = counters
+        lines = {name: [] for name in self.families}
+        for key, value in gauges.items():
+            lines[key[0]].append(self._prefix(key) + b"%.2f\n" % value)
+        for key, value in self.counters.items():
+            lines[key[0]].append(self._prefix(key) + b"%.3f\n" % value)
+
+        # Forget the prefixes of series that are gone once they outnumber the live ones
+        if len(self.prefixes) > 2 * (len(gauges) + len(self.counters)):
+            live = set(gauges) | set(self.counters)
+            self.prefixes = {key: prefix for key, prefix in self.prefixes.items() if key in live}
+
+        # Swapping in a new bytes object is atomic, so scrapes never see a half-built body
+        self.body = b"".join(self.headers[name] + b"".join(family_lines)
+                             for name, family_lines in lines.items() if family_lines)
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.server.buffer.body
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # One line per scrape would drown the console
+
+def get_exporter_input():
+    """Prompt for the listen address and port; returns (address, port), or (None, None) on invalid input."""
+    address = input("Enter the address to listen on [Default: 127.0.0.1]: ").strip() or "127.0.0.1"
+    try:
+        port = int(input(f"Enter the port to serve metrics on [Default: {DEFAULT_PORT}]: ").strip() or DEFAULT_PORT)
+    except ValueError:
+        print("The port must be a numeric value.")
+        return None, None
+    return address, port
+
+def run_exporter(capture_sample, to_metrics, families, interval, address, port, keep_series=None):
+    """Serve /metrics while capturing samples back to back until Ctrl+C.
+
+    capture_sample(interval) returns (header, rows, peak) like the adaptive capture;
+    to_metrics(header, rows, interval) turns one sample into (gauges, counter increments)
+    keyed as in MetricsBuffer, which passes keep_series on to MetricsBuffer.update.
+    """
+    buffer = MetricsBuffer({**families, **EXPORTER_FAMILIES})
+    try:
+        server = ThreadingHTTPServer((address, port), MetricsHandler)
+    except OSError as e:
+        print(f"Cannot listen on {address}:{port}: {e}")
+        return
+    server.daemon_threads = True
+    server.buffer = buffer
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Serving metrics on http://{address}:{port}/metrics every {interval}s. Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            header, rows, _ = capture_sample(interval)
+            if header is None:
+                print("No sample captured, retrying.")
+                time.sleep(interval)
+                continue
+            gauges, increments = to_metrics(header, rows, interval)
+            gauges[('sysstat_exporter_last_sample_timestamp_seconds', ())] = time.time()
+            increments[('sysstat_exporter_samples_total', ())] = 1
+            buffer.update(gauges, increments, keep_series)
+    except KeyboardInterrupt:
+        print("Exporter stopped.")
+    finally:
+        server.shutdown()
+        server.server_close()
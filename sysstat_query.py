@@ -0,0 +1,247 @@
+"""Importable loaders for the CSVs written by mpstat_csv.py and pidstat_csv.py.
+
+    from sysstat_query import load_mpstat, load_pidstat
+    df = load_mpstat("mpstat_data", metrics=["%usr", "%idle"], cpus=["all", 0])
+
+Only the requested columns are parsed, and rows are selected chunk by chunk
+with vectorized masks, so rows the caller did not ask for never pile up in
+memory. Frames come back typed: metrics as float64, Epoch as nullable Int64
+(empty on 'Average:' rows), CPU as str ('all', '0', ...) and TID as int.
+Interval is the length in seconds of each sample: per row for adaptive
+captures, otherwise the run's interval from its metadata. Weight per-interval
+rows by it when averaging.
+"""
+import csv
+import glob
+import os
+import re
+from datetime import datetime
+import pandas as pd
+from pidstat_csv import PIDSTAT_COLUMNS, PIDSTAT_REPORTS
+from run_metadata import read_run_metadata
+from segment_store import MANIFEST, segments_for_range, parse_time_bound
+
+# Rows read at a time, so memory stays flat however long the capture
+LOAD_CHUNK_ROWS = 500_000
+
+MPSTAT_METRICS = ['%usr', '%nice', '%sys', '%iowait', '%irq', '%soft', '%steal', '%guest', '%gnice', '%idle']
+PIDSTAT_METRICS = [m for report in 'urdw' for m in PIDSTAT_REPORTS[report]]
+
+def time_bounds(time_range):
+    """(start, end) in epoch seconds from epochs, datetimes or 'YYYY-mm-dd HH:MM' strings; None is open-ended."""
+    if not time_range:
+        return None, None
+
+    def to_epoch(bound):
+        if bound is None or isinstance(bound, (int, float)):
+            return bound
+        if isinstance(bound, datetime):
+            return int(bound.timestamp())
+        return parse_time_bound(str(bound))
+
+    start, end = time_range
+    return to_epoch(start), to_epoch(end)
+
+def resolve_paths(paths, time_range=None, tool=None, exclude=()):
+    """Expand CSV files, directories and daemon segment directories into a list of CSV paths.
+
+    'paths' is a path, a comma-separated string or a list. Segment directories
+    contribute only the segments overlapping time_range; plain directories
+    contribute every CSV whose name contains none of 'exclude'.
+    """
+    if isinstance(paths, str):
+        paths = [p.strip() for p in paths.split(',')]
+    start, end = time_bounds(time_range)
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path) and os.path.exists(os.path.join(path, MANIFEST)):
+            files += segments_for_range(path, start, end, tool)
+        elif os.path.isdir(path):
+            files += sorted(f for f in glob.glob(os.path.join(path, '*.csv'))
+                            if not any(pattern in os.path.basename(f) for pattern in exclude))
+        elif os.path.isfile(path):
+            files.append(path)
+        else:
+            print(f"Warning: {path} does not exist. Skipping...")
+    return files
+
+def _time_mask(epoch, start, end):
+    """Rows whose Epoch lies in [start, end]; rows without an Epoch only pass an open range."""
+    mask = pd.Series(True, index=epoch.index)
+    if start is not None:
+        mask &= epoch >= start
+    if end is not None:
+        mask &= epoch <= end
+    return mask.fillna(False).astype(bool)
+
+def _read_chunks(file, header, columns, has_header=True, text_columns=(), na_values=None):
+    """Yield 'columns' of a CSV laid out as 'header' in chunks of LOAD_CHUNK_ROWS rows.
+
+    The last column only holds numbers or nothing, so rows with text there are
+    dropped: repeated header rows, and rows with more fields than the header
+    (a command split at a space by older versions of pidstat_csv.py).
+    """
+    last = header[-1]
+    usecols = list(dict.fromkeys(columns + [last]))
+    reader = pd.read_csv(file, header=0 if has_header else None, names=None if has_header else header,
+                         usecols=usecols, index_col=False, dtype={col: str for col in text_columns if col in usecols},
+                         keep_default_na=False, na_values=na_values, skipinitialspace=True, chunksize=LOAD_CHUNK_ROWS)
+    for chunk in reader:
+        tail = chunk[last]
+        aligned = (tail == '') | pd.to_numeric(tail, errors='coerce').notnull()
+        yield chunk.loc[aligned, columns]
+
+def _typed_frame(df, numeric):
+    """Convert the 'numeric' columns to float64 and Epoch and Interval to Int64."""
+    for col in numeric:
+        df[col] = pd.to_numeric(df[col], errors='coerce').astype('float64')
+    for col in ('Epoch', 'Interval'):
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+    return df
+
+def _fill_time_columns(df, file):
+    """Add Epoch and Interval when the CSV predates them; Interval then comes from the run metadata."""
+    if 'Epoch' not in df.columns:
+        df['Epoch'] = pd.Series(pd.NA, index=df.index, dtype='Int64')
+    if 'Interval' not in df.columns:
+        interval = read_run_metadata(file).get('interval')
+        df['Interval'] = pd.Series(interval if interval else pd.NA, index=df.index, dtype='Int64')
+    return df
+
+def _read_header(file):
+    with open(file, newline='') as f:
+        return next(csv.reader(f), None)
+
+def load_mpstat(paths, metrics=None, cpus=None, time_range=None, summary_only=True):
+    """Load mpstat CSVs into one frame: File, Timestamp, CPU, the requested metrics, Epoch and Interval.
+
+    metrics:      metric columns to keep (default: every %-column in the file).
+                  Files lacking a requested metric are skipped.
+    cpus:         CPUs to keep, e.g. ['all', 0, 3] (default: all of them).
+    time_range:   (start, end) as epochs, datetimes or 'YYYY-mm-dd HH:MM'; selects
+                  daemon segments and, for per-interval rows, the rows themselves.
+    summary_only: True for the 'Average:' rows, False for the per-interval rows.
+    """
+    start, end = time_bounds(time_range)
+    cpus = [str(cpu) for cpu in cpus] if cpus is not None else None
+    data_frames = []
+
+    for file in resolve_paths(paths, time_range, 'mpstat', exclude=('_irq_',)):
+        try:
+            header = [col.strip() for col in _read_header(file) or []]
+            if 'Timestamp' not in header or 'CPU' not in header:
+                print(f"Warning: {file} is not an mpstat CSV. Skipping...")
+                continue
+            wanted = metrics or [m for m in MPSTAT_METRICS if m in header]
+            missing = [m for m in wanted if m not in header]
+            if missing:
+                print(f"Warning: Column(s) {missing} not found in {file}. Skipping...")
+                continue
+            if not summary_only and (start is not None or end is not None) and 'Epoch' not in header:
+                print(f"Warning: {file} has no Epoch column to filter by time. Skipping...")
+                continue
+
+            selected = ['Timestamp', 'CPU'] + wanted + [col for col in ('Epoch', 'Interval') if col in header]
+            chunks = []
+            for chunk in _read_chunks(file, header, selected, text_columns=('Timestamp', 'CPU')):
+                cpu = chunk['CPU']
+                mask = ((cpu == 'all') | cpu.str.isdigit()) & ((chunk['Timestamp'] == 'Average:') == summary_only)
+                if cpus is not None:
+                    mask &= cpu.isin(cpus)
+                if not summary_only and 'Epoch' in chunk.columns:
+                    mask &= _time_mask(pd.to_numeric(chunk['Epoch'], errors='coerce'), start, end)
+                chunks.append(chunk[mask])
+
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            if df.empty:
+                continue
+            df = _fill_time_columns(_typed_frame(df[selected], wanted), file)
+            df.insert(0, 'File', os.path.basename(file))
+            data_frames.append(df)
+
+        except Exception as e:
+            print(f"Error processing {file}: {e}")
+
+    if not data_frames:
+        return pd.DataFrame()
+    return pd.concat(data_frames, ignore_index=True)
+
+def load_pidstat(paths, metrics=None, threshold=None, command_pattern=None, tids=None, time_range=None, summary_only=True,
+                 exclude=('_metrics', '_placement')):
+    """Load pidstat CSVs (pid_<pid>_info.csv or pid_<pid>_metrics.csv) into one frame.
+
+    Columns: File, Timestamp, Epoch, Interval, UID, TID, TGID, Command and the requested metrics
+    (default: every metric the file has). TID is the TGID of process rows and the
+    TID of thread rows. threshold, command_pattern and tids select rows the way
+    make_row_filter() does; threshold is ignored for files without %CPU.
+    time_range and summary_only work as in load_mpstat(). Directories contribute
+    the CSVs whose name contains none of 'exclude': by default the pid_<pid>_info.csv
+    files, as the _metrics.csv files repeat the same threads.
+    """
+    start, end = time_bounds(time_range)
+    command_re = re.compile(command_pattern) if command_pattern else None
+    tids = [int(tid) for tid in tids if str(tid).isdigit()] if tids else None
+    data_frames = []
+
+    for file in resolve_paths(paths, time_range, exclude=exclude):
+        try:
+            first = _read_header(file)
+            if not first:
+                continue
+            # CSVs without a header row use the layout written by pidstat_csv.py
+            has_header = first[0] == 'Timestamp' and 'Command' in first
+            header = first if has_header else PIDSTAT_COLUMNS
+            if 'TID' not in header or len(first) <= header.index('Command'):
+                print(f"Warning: {file} is not a pidstat CSV. Skipping...")
+                continue
+
+            wanted = [m for m in (metrics or PIDSTAT_METRICS) if m in header]
+            if metrics and not wanted:
+                print(f"Warning: None of {metrics} found in {file}. Skipping...")
+                continue
+            if not summary_only and (start is not None or end is not None) and 'Epoch' not in header:
+                print(f"Warning: {file} has no Epoch column to filter by time. Skipping...")
+                continue
+
+            filter_cpu = threshold is not None and '%CPU' in header
+            selected = ['Timestamp', 'UID'] + wanted + [col for col in ('Epoch', 'Interval') if col in header]
+            columns = list(dict.fromkeys(selected + ['TGID', 'TID', 'Command'] + (['%CPU'] if filter_cpu else [])))
+            chunks = []
+            for chunk in _read_chunks(file, header, columns, has_header, text_columns=('Timestamp', 'Command'),
+                                      na_values={'TGID': ['-'], 'TID': ['-']}):
+                mask = (chunk['Timestamp'] == 'Average:') == summary_only
+                # Thread rows carry '-' as TGID, process rows '-' as TID; header rows carry neither
+                tgid, tid = pd.to_numeric(chunk['TGID'], errors='coerce'), pd.to_numeric(chunk['TID'], errors='coerce')
+                mask &= tgid.notnull() | tid.notnull()
+                key = tgid.fillna(tid)
+                command = chunk['Command']
+                if filter_cpu:
+                    cpu = pd.to_numeric(chunk['%CPU'], errors='coerce')
+                    mask &= cpu.isnull() | (cpu >= threshold)
+                if command_re:
+                    mask &= command.str.replace('|__', '', n=1, regex=False).str.contains(command_re)
+                if tids is not None:
+                    mask &= key.isin(tids)
+                if not summary_only and 'Epoch' in chunk.columns:
+                    mask &= _time_mask(pd.to_numeric(chunk['Epoch'], errors='coerce'), start, end)
+                chunks.append(chunk.loc[mask, selected].assign(TGID=tgid[mask], TID=key[mask], Command=command[mask]))
+
+            df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame()
+            if df.empty:
+                continue
+            df = _typed_frame(df, wanted)
+            df['TID'] = df['TID'].astype(int)
+            df['TGID'] = df['TGID'].astype('Int64')
+            df['UID'] = pd.to_numeric(df['UID'], errors='coerce').astype('Int64')
+            df = _fill_time_columns(df, file)
+            df.insert(0, 'File', os.path.basename(file))
+            data_frames.append(df[['File', 'Timestamp', 'Epoch', 'Interval', 'UID', 'TID', 'TGID', 'Command'] + wanted])
+
+        except Exception as e:
+            print(f"Error processing {file}: {e}")
+
+    if not data_frames:
+        return pd.DataFrame()
+    return pd.concat(data_frames, ignore_index=True)
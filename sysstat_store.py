@@ -0,0 +1,285 @@
+"""Local SQLite store of ingested mpstat and pidstat runs.
+
+Each CSV becomes one run. Its per-interval rows go to mpstat_samples or
+pidstat_samples, indexed on (run_id, host, cpu/tid, epoch). Per-run
+summaries (sample count, average and maximum of every metric) are computed
+once at ingest time into mpstat_summary and pidstat_summary, so cross-run
+reports read a few rows per CPU or thread instead of rescanning the CSVs.
+"""
+import csv
+import os
+import re
+import sqlite3
+import time
+from contextlib import closing
+import pandas as pd
+from mpstat_plot import plot_metric, merge_pdfs
+from run_metadata import read_run_metadata
+from sysstat_query import MPSTAT_METRICS, PIDSTAT_METRICS, load_mpstat, load_pidstat, resolve_paths, time_bounds
+
+DEFAULT_DB = "sysstat_runs.db"
+BATCH_SIZE = 10000
+
+def sql_column(metric):
+    """'%usr' -> 'pct_usr', 'kB_rd/s' -> 'kB_rd_s'; pidstat's processor number 'CPU' -> 'core'."""
+    if metric == 'CPU':
+        return 'core'
+    return re.sub(r'\W', '_', metric.replace('%', 'pct_'))
+
+# (key columns, metrics) of the samples and summary tables of each tool
+TABLES = {
+    'mpstat': (['cpu'], MPSTAT_METRICS),
+    'pidstat': (['tid', 'tgid', 'uid', 'command'], PIDSTAT_METRICS),
+}
+
+def _schema(tool):
+    keys, metrics = TABLES[tool]
+    key_index = keys[0]
+    metric_columns = ", ".join(f"{sql_column(m)} REAL" for m in metrics)
+    stat_columns = ", ".join(f"{stat}_{sql_column(m)} REAL" for stat in ('avg', 'max') for m in metrics)
+    key_columns = ", ".join(keys)
+    return [
+        f"CREATE TABLE IF NOT EXISTS {tool}_samples (run_id INTEGER, host TEXT, {key_columns}, "
+        f"epoch INTEGER, timestamp TEXT, interval INTEGER, {metric_columns})",
+        f"CREATE INDEX IF NOT EXISTS idx_{tool}_samples ON {tool}_samples (run_id, host, {key_index}, epoch)",
+        f"CREATE TABLE IF NOT EXISTS {tool}_summary (run_id INTEGER, host TEXT, {key_columns}, samples INTEGER, {stat_columns})",
+        f"CREATE INDEX IF NOT EXISTS idx_{tool}_summary ON {tool}_summary (run_id, host, {key_index})",
+    ]
+
+def connect(db_path=DEFAULT_DB):
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS runs (run_id INTEGER PRIMARY KEY, path TEXT UNIQUE, name TEXT, "
+                 "tool TEXT, host TEXT, start_epoch INTEGER, end_epoch INTEGER, ingested_at INTEGER)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs ON runs (tool, host, start_epoch)")
+    for tool in TABLES:
+        for statement in _schema(tool):
+            conn.execute(statement)
+        # Databases created before adaptive sampling have no interval column
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({tool}_samples)")]
+        if 'interval' not in columns:
+            conn.execute(f"ALTER TABLE {tool}_samples ADD COLUMN interval INTEGER")
+    return conn
+
+def detect_tool(path):
+    """'mpstat', 'pidstat' or None, from the CSV header."""
+    with open(path, newline='') as f:
+        header = next(csv.reader(f), [])
+    if '%idle' in header and 'CPU' in header:
+        return 'mpstat'
+    if 'TID' in header or ('%CPU' in header and 'Command' in header) or os.path.basename(path).startswith('pid_'):
+        return 'pidstat'
+    return None
+
+def _records(df, columns):
+    """Rows of df[columns] as tuples with NaN/NA turned into NULL."""
+    values = df[columns].astype(object).where(df[columns].notnull(), None)
+    return list(values.itertuples(index=False, name=None))
+
+def _insert(conn, table, columns, records):
+    statement = f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+    for start in range(0, len(records), BATCH_SIZE):
+        conn.executemany(statement, records[start:start + BATCH_SIZE])
+
+def _summarize(samples, averages, keys, metrics):
+    """Sample count and max from the interval rows, average from sysstat's 'Average:' rows when present.
+
+    Without them the average is weighted by each sample's Interval.
+    """
+    grouped = samples.groupby(keys, sort=False, dropna=False)[metrics]
+    weights = samples['Interval'].fillna(1).astype('float64')
+    weighted = samples[metrics].mul(weights, axis=0).groupby([samples[k] for k in keys], sort=False, dropna=False).sum() \
+        / samples[metrics].notnull().mul(weights, axis=0).groupby([samples[k] for k in keys], sort=False, dropna=False).sum()
+    summary = weighted.add_prefix('avg_').join(grouped.max().add_prefix('max_'))
+    summary.insert(0, 'samples', grouped.size())
+    if not averages.empty:
+        reported = averages.drop_duplicates(keys).set_index(keys)[metrics].add_prefix('avg_')
+        summary.update(reported)
+    return summary.reset_index()
+
+def ingest_file(conn, path, tool=None):
+    """Load one CSV as a run; returns the run_id, or None when it was skipped."""
+    path = os.path.abspath(path)
+    if conn.execute("SELECT 1 FROM runs WHERE path = ?", (path,)).fetchone():
+        print(f"{path} is already ingested. Skipping...")
+        return None
+    tool = tool or detect_tool(path)
+    if tool not in TABLES:
+        print(f"Warning: {path} is not an mpstat or pidstat CSV. Skipping...")
+        return None
+
+    keys, metrics = TABLES[tool]
+    if tool == 'mpstat':
+        samples = load_mpstat([path], summary_only=False)
+        averages = load_mpstat([path], summary_only=True)
+        frame_keys = ['CPU']
+    else:
+        samples = load_pidstat([path], summary_only=False)
+        averages = load_pidstat([path], summary_only=True)
+        frame_keys = ['TID', 'TGID', 'UID', 'Command']
+    if samples.empty:
+        print(f"Warning: No interval rows in {path}. Skipping...")
+        return None
+
+    present = [m for m in metrics if m in samples.columns]
+    metric_columns = [sql_column(m) for m in present]
+    host = read_run_metadata(path).get('host', 'unknown')
+    epochs = samples['Epoch'].dropna()
+
+    with conn:
+        run_id = conn.execute(
+            "INSERT INTO runs (path, name, tool, host, start_epoch, end_epoch, ingested_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (path, os.path.basename(path), tool, host,
+             int(epochs.min()) if len(epochs) else None, int(epochs.max()) if len(epochs) else None, int(time.time()))
+        ).lastrowid
+
+        samples.insert(0, 'run_id', run_id)
+        samples.insert(1, 'host', host)
+        _insert(conn, f"{tool}_samples", ['run_id', 'host'] + keys + ['epoch', 'timestamp', 'interval'] + metric_columns,
+                _records(samples, ['run_id', 'host'] + frame_keys + ['Epoch', 'Timestamp', 'Interval'] + present))
+
+        summary = _summarize(samples, averages, frame_keys, present)
+        summary.insert(0, 'run_id', run_id)
+        summary.insert(1, 'host', host)
+        stat_frame_columns = [f"{stat}_{m}" for stat in ('avg', 'max') for m in present]
+        stat_columns = [f"{stat}_{c}" for stat in ('avg', 'max') for c in metric_columns]
+        _insert(conn, f"{tool}_summary", ['run_id', 'host'] + keys + ['samples'] + stat_columns,
+                _records(summary, ['run_id', 'host'] + frame_keys + ['samples'] + stat_frame_columns))
+
+    print(f"Ingested {path} as {tool} run {run_id} ({len(samples)} rows)")
+    return run_id
+
+def ingest(paths, db_path=DEFAULT_DB):
+    """Ingest CSV files, directories or daemon segment directories; returns the new run ids."""
+    run_ids = []
+    with closing(connect(db_path)) as conn:
+        # One run per capture: skip mpstat interrupt tables and the pidstat per-thread report and placement files
+        for path in resolve_paths(paths, exclude=('_irq_', '_metrics', '_placement')):
+            try:
+                run_id = ingest_file(conn, path)
+            except Exception as e:
+                print(f"Error ingesting {path}: {e}")
+                continue
+            if run_id is not None:
+                run_ids.append(run_id)
+    return run_ids
+
+def _run_filter(runs=None, host=None):
+    """WHERE clause fragment and parameters selecting runs by id or name pattern and host."""
+    clauses, params = [], []
+    if runs:
+        ids = [r for r in runs if isinstance(r, int)]
+        patterns = [r for r in runs if not isinstance(r, int)]
+        alternatives = []
+        if ids:
+            alternatives.append(f"r.run_id IN ({', '.join('?' * len(ids))})")
+            params += ids
+        for pattern in patterns:
+            alternatives.append("r.name GLOB ?")
+            params.append(pattern)
+        clauses.append("(" + " OR ".join(alternatives) + ")")
+    if host:
+        clauses.append("r.host = ?")
+        params.append(host)
+    return clauses, params
+
+def list_runs(db_path=DEFAULT_DB, tool=None, host=None, runs=None):
+    clauses, params = _run_filter(runs, host)
+    if tool:
+        clauses.append("r.tool = ?")
+        params.append(tool)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    with closing(connect(db_path)) as conn:
+        return pd.read_sql_query(f"SELECT r.* FROM runs r{where} ORDER BY r.start_epoch", conn, params=params)
+
+def query_summary(db_path=DEFAULT_DB, tool='mpstat', metrics=None, stat='avg', runs=None, host=None):
+    """Per-run summary rows with the original metric names, e.g. File, CPU, %usr for mpstat.
+
+    'runs' is a list of run ids or file name patterns ('cpu_usage*.csv').
+    With stat='avg' the mpstat frame matches what load_and_extract_cpu_data() returns.
+    """
+    keys, all_metrics = TABLES[tool]
+    metrics = metrics or all_metrics
+    clauses, params = _run_filter(runs, host)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    renames = {'name': 'File', 'cpu': 'CPU', 'tid': 'TID', 'tgid': 'TGID', 'uid': 'UID', 'command': 'Command', 'host': 'Host'}
+    selected = ", ".join(f's.{stat}_{sql_column(m)} AS "{m}"' for m in metrics)
+
+    with closing(connect(db_path)) as conn:
+        df = pd.read_sql_query(
+            f"SELECT r.name, s.host, {', '.join('s.' + k for k in keys)}, s.samples, {selected} "
+            f"FROM {tool}_summary s JOIN runs r ON r.run_id = s.run_id{where} ORDER BY r.start_epoch, s.rowid",
+            conn, params=params)
+    return df.rename(columns=renames)
+
+def query_samples(db_path=DEFAULT_DB, tool='mpstat', metrics=None, runs=None, host=None, keys=None, time_range=None):
+    """Per-interval rows of the selected runs, for the given CPUs (mpstat) or TIDs (pidstat) and time range."""
+    key_column, all_metrics = TABLES[tool][0][0], TABLES[tool][1]
+    metrics = metrics or all_metrics
+    clauses, params = _run_filter(runs, host)
+    if keys:
+        keys = [str(k) for k in keys] if tool == 'mpstat' else [int(k) for k in keys]
+        clauses.append(f"s.{key_column} IN ({', '.join('?' * len(keys))})")
+        params += keys
+    start, end = time_bounds(time_range)
+    if start is not None:
+        clauses.append("s.epoch >= ?")
+        params.append(start)
+    if end is not None:
+        clauses.append("s.epoch <= ?")
+        params.append(end)
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+    extra = ", s.tgid AS TGID, s.command AS Command" if tool == 'pidstat' else ""
+    selected = ", ".join(f's.{sql_column(m)} AS "{m}"' for m in metrics)
+
+    with closing(connect(db_path)) as conn:
+        return pd.read_sql_query(
+            f'SELECT r.name AS File, s.host AS Host, s.{key_column} AS "{key_column.upper()}"{extra}, '
+            f"s.epoch AS Epoch, s.timestamp AS Timestamp, s.interval AS Interval, {selected} "
+            f"FROM {tool}_samples s JOIN runs r ON r.run_id = s.run_id{where} ORDER BY s.run_id, s.epoch",
+            conn, params=params)
+
+def generate_report(db_path, runs=None, host=None):
+    """mpstat comparison PDFs of the selected runs, built from the summary table."""
+    output_dir = "mpstat_plots"
+    os.makedirs(output_dir, exist_ok=True)
+    generated_pdfs = []
+    summary = query_summary(db_path, 'mpstat', runs=runs, host=host)
+    if summary.empty:
+        print("No mpstat runs match the selection.")
+        return
+
+    for metric in ['%usr', '%sys', '%idle', '%iowait', '%irq', '%soft', '%steal', '%guest', '%gnice']:
+        df = summary[['File', 'CPU', metric]].dropna()
+        if df.empty:
+            continue
+        pdf_path = os.path.join(output_dir, f'{metric}_comparison.pdf')
+        plot_metric(df, metric, metric, pdf_path)
+        generated_pdfs.append(pdf_path)
+
+    if generated_pdfs:
+        merge_pdfs(generated_pdfs, os.path.join(output_dir, "mpstat_comparison_merged.pdf"))
+
+def main():
+    action = input("Action (ingest/runs/report) [Default: ingest]: ").strip().lower() or "ingest"
+    db_path = input(f"Enter the database path [Default: {DEFAULT_DB}]: ").strip() or DEFAULT_DB
+
+    if action == "ingest":
+        paths = input("Enter CSV files or directories to ingest (comma separated) [Default: mpstat_data,pidstat_data]: ").strip() \
+            or "mpstat_data,pidstat_data"
+        run_ids = ingest([p.strip() for p in paths.split(',') if os.path.exists(p.strip())], db_path)
+        print(f"Ingested {len(run_ids)} runs into {db_path}")
+    elif action in ("runs", "report"):
+        host = input("Host to select (press Enter for all): ").strip() or None
+        patterns = input("Run file name patterns, e.g. cpu_usage*.csv (comma separated, press Enter for all): ").strip()
+        runs = [p.strip() for p in patterns.split(',')] if patterns else None
+        if action == "runs":
+            print(list_runs(db_path, host=host, runs=runs).to_string(index=False))
+        else:
+            generate_report(db_path, runs, host)
+    else:
+        print(f"Unknown action '{action}'.")
+
+if __name__ == "__main__":
+    main()
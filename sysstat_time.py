@@ -0,0 +1,96 @@
+import os
+import re
+from datetime import date, datetime, time, timedelta
+
+# Make sysstat print 24-hour times and an ISO date in the report header, whatever the user's locale
+SYSSTAT_ENV = {'LC_ALL': 'C', 'S_TIME_FORMAT': 'ISO'}
+
+TIME_TOKEN = re.compile(r"(\d{1,2}):(\d{2}):(\d{2})")
+ISO_DATE_TOKEN = re.compile(r"(\d{4})-(\d{2})-(\d{2})")
+ISO_DATETIME_TOKEN = re.compile(r"(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})")
+US_DATE_TOKEN = re.compile(r"(\d{2})/(\d{2})/(\d{2}|\d{4})")
+# Largest step between consecutive times read as the same day, in seconds
+HALF_DAY = 12 * 3600
+
+def sysstat_env():
+    env = dict(os.environ)
+    env.update(SYSSTAT_ENV)
+    return env
+
+def split_timestamp(fields):
+    """Number of leading fields that form a sysstat timestamp, or 0 if the row has none.
+
+    Handles '12:00:01 PM' (12-hour locales), '12:00:01' (24-hour locales) and
+    '2026-10-19 12:00:01' / '2026-10-19T12:00:01' (ISO).
+    """
+    if not fields:
+        return 0
+    if ISO_DATETIME_TOKEN.fullmatch(fields[0]):
+        return 1
+    if ISO_DATE_TOKEN.fullmatch(fields[0]) and len(fields) > 1 and TIME_TOKEN.fullmatch(fields[1]):
+        return 2
+    if TIME_TOKEN.fullmatch(fields[0]):
+        return 2 if len(fields) > 1 and fields[1] in ('AM', 'PM') else 1
+    return 0
+
+def parse_header_date(line):
+    """Date of a 'Linux 5.15.0 (host) 2026-10-19 _x86_64_ (8 CPU)' header line, or None."""
+    if not line.startswith("Linux"):
+        return None
+    for token in line.split():
+        match = ISO_DATE_TOKEN.fullmatch(token)
+        if match:
+            return date(*map(int, match.groups()))
+        match = US_DATE_TOKEN.fullmatch(token)
+        if match:
+            month, day, year = map(int, match.groups())
+            return date(year + 2000 if year < 100 else year, month, day)
+    return None
+
+class ReportClock:
+    """Turns the timestamps of one sysstat report into int epoch seconds.
+
+    The date comes from the report header (or today when there is none). Each time
+    is then placed on the day that keeps it within 12 hours of the previous one:
+    going from 23:59:59 to 00:00:00 is midnight, while a table header repeating
+    the previous sample's time (sysstat prints headers that way) moves nothing.
+    sysstat prints whole seconds, so seconds lose nothing.
+    """
+
+    def __init__(self, report_date=None):
+        self.date = report_date or date.today()
+        self.previous = None
+
+    def feed_header(self, line):
+        header_date = parse_header_date(line)
+        if header_date:
+            self.date = header_date
+            self.previous = None
+
+    def observe(self, timestamp):
+        """Track the time of a row that gets no epoch, e.g. a table header at 23:59:59,
+        so the date still advances when the next row is past midnight."""
+        self.epoch(timestamp)
+
+    def epoch(self, timestamp):
+        fields = timestamp.split()
+        if len(fields) == 1 and 'T' in fields[0]:
+            fields = fields[0].split('T')
+
+        date_match = ISO_DATE_TOKEN.fullmatch(fields[0])
+        if date_match:
+            self.date, self.previous = date(*map(int, date_match.groups())), None
+            fields = fields[1:]
+
+        hour, minute, second = map(int, TIME_TOKEN.fullmatch(fields[0]).groups())
+        if len(fields) > 1:
+            hour = hour % 12 + (12 if fields[1] == 'PM' else 0)
+        seconds = hour * 3600 + minute * 60 + second
+
+        if self.previous is not None and seconds < self.previous - HALF_DAY:
+            self.date += timedelta(days=1)
+        elif self.previous is not None and seconds > self.previous + HALF_DAY:
+            self.date -= timedelta(days=1)  # A header row from just before midnight
+        self.previous = seconds
+
+        return int(datetime.combine(self.date, time(hour, minute, second)).timestamp())
@@ -0,0 +1,51 @@
+from datetime import datetime
+from mpstat_csv import parse_mpstat_output, parse_mpstat_interrupts
+from pidstat_csv import parse_pidstat_output, parse_pidstat_metrics
+from sysstat_time import ReportClock
+
+# sysstat prints each table header with the time of the previous sample,
+# so a run started at 23:59:59 has its headers before midnight and its first rows after it
+MPSTAT_OUTPUT = """Linux 6.1.0 (host) 2026-10-19 _x86_64_ (1 CPU)
+
+23:59:59     CPU    %usr   %nice    %sys %iowait    %irq   %soft  %steal  %guest  %gnice   %idle
+00:00:00     all    1.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00   99.00
+00:00:00       0    1.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00   99.00
+
+23:59:59     CPU    intr/s
+00:00:00     all    100.00
+
+00:00:00     CPU    %usr   %nice    %sys %iowait    %irq   %soft  %steal  %guest  %gnice   %idle
+00:00:01     all    2.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00   98.00
+00:00:01       0    2.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00    0.00   98.00
+
+00:00:00     CPU    intr/s
+00:00:01     all    100.00
+"""
+
+PIDSTAT_OUTPUT = """Linux 6.1.0 (host) 2026-10-19 _x86_64_ (1 CPU)
+
+23:59:59      UID      TGID       TID    %usr %system  %guest   %wait    %CPU   CPU  Command
+00:00:00     1000      1234         -    1.00    0.00    0.00    0.00    1.00     0  java
+00:00:00     1000         -      1235    1.00    0.00    0.00    0.00    1.00     0  |__C2 CompilerThre
+"""
+
+MIDNIGHT = int(datetime(2026, 10, 20).timestamp())
+
+def test_clock_rolls_over_once_at_midnight():
+    clock = ReportClock(datetime(2026, 10, 19).date())
+    clock.observe("23:59:59")
+    assert clock.epoch("00:00:00") == MIDNIGHT
+    clock.observe("00:00:00")  # Header repeating the previous sample's time
+    assert clock.epoch("00:00:01") == MIDNIGHT + 1
+
+def test_mpstat_tables_agree_after_midnight():
+    rows = [row for row in parse_mpstat_output(MPSTAT_OUTPUT) if row[1] != 'CPU']
+    assert [row[-1] for row in rows] == [MIDNIGHT, MIDNIGHT, MIDNIGHT + 1, MIDNIGHT + 1]
+    interrupts = parse_mpstat_interrupts(MPSTAT_OUTPUT)['SUM']
+    assert [row[-1] for row in interrupts[1:]] == [MIDNIGHT, MIDNIGHT + 1]
+
+def test_pidstat_rows_after_midnight():
+    rows = parse_pidstat_output(PIDSTAT_OUTPUT)
+    assert [row[-1] for row in rows[1:]] == [MIDNIGHT, MIDNIGHT]
+    metrics = parse_pidstat_metrics(PIDSTAT_OUTPUT, 'u')
+    assert [row[1] for row in metrics[1:]] == [MIDNIGHT, MIDNIGHT]